@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+# compares the html extraction backends on saved webpages.
+#
+# usage:
+#   python benchmarks/bench_html_extract.py page1.html page2.html ...
+#
+# save some real pages first (for example with "curl -o page.html <url>"),
+# synthetic pages don't tell you much about how the parsers behave.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_extract
+
+ROUNDS = 5
+
+def bench(html, backend):
+    # best of a few rounds, the first one tends to include import costs
+    best = None
+    output = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        output = html_extract.extract(html, backend=backend)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, output
+
+def normalize(output):
+    # whitespace is where the parsers are allowed to differ
+    if isinstance(output, str):
+        return " ".join(output.split())
+    if isinstance(output, dict):
+        return {key: normalize(value) for key, value in output.items()}
+    if isinstance(output, list):
+        return [normalize(value) for value in output]
+    return output
+
+def main(paths):
+    if not paths:
+        print("usage: bench_html_extract.py page.html [page.html ...]")
+        return 1
+
+    backends = html_extract.available_backends()
+    print(f"backends: {', '.join(backends)}")
+
+    totals = {backend: 0.0 for backend in backends}
+    for path in paths:
+        with open(path, "rb") as f:
+            html = f.read()
+
+        print(f"\n{os.path.basename(path)} ({len(html) / 1024:.0f}KB)")
+
+        reference = None
+        for backend in backends:
+            elapsed, output = bench(html, backend)
+            totals[backend] += elapsed
+
+            # the backends should agree on what's in a page, apart from whitespace details.
+            # the values are compared too, so a backend that decodes the page wrong stands out
+            if reference is None:
+                reference = normalize(output)
+                note = ""
+            elif output.keys() != reference.keys():
+                note = " (different output!)"
+            else:
+                note = "" if normalize(output) == reference else " (different text!)"
+
+            print(f"  {backend:<12}{elapsed * 1000:9.1f}ms{note}")
+
+    print("\ntotal")
+    for backend, elapsed in totals.items():
+        print(f"  {backend:<12}{elapsed * 1000:9.1f}ms")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
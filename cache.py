@@ -0,0 +1,375 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import contextlib
+import urllib.parse
+
+import utils
+
+# on-disk caches for the reader. every entry is a plain file, and the least recently
+# used ones are removed once a cache grows past its size cap
+
+MB = 1024 * 1024
+
+HTTP_CACHE_MAX_SIZE = 256 * MB
+# don't bother caching huge downloads, they'd push everything else out
+HTTP_CACHE_MAX_ENTRY_SIZE = 16 * MB
+PROCESSED_CACHE_MAX_SIZE = 128 * MB
+THUMBNAIL_CACHE_MAX_SIZE = 64 * MB
+SEARCH_CACHE_MAX_SIZE = 8 * MB
+TRANSCRIPT_CACHE_MAX_SIZE = 32 * MB
+# search results go stale quickly, but follow-up questions on the same topic usually come soon after
+SEARCH_CACHE_TTL = 15 * 60
+
+def normalize_url(url):
+    """normalizes a url so that trivially different ways of writing it share a cache entry"""
+
+    parsed = urllib.parse.urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = (parsed.hostname or "").lower()
+
+    # leave out the port if it's the default one anyway
+    if parsed.port and (scheme, parsed.port) not in (("http", 80), ("https", 443)):
+        netloc += f":{parsed.port}"
+    if parsed.username:
+        netloc = f"{parsed.username}@{netloc}"
+
+    query = urllib.parse.urlencode(
+        sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+    )
+
+    return urllib.parse.urlunsplit((scheme, netloc, parsed.path or "/", query, ""))
+
+def _key(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def _write_atomic(path, data):
+    tmp_path = path+".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _touch(*paths):
+    # marks an entry as recently used
+    for path in paths:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+def _evict(cache_path, max_size):
+    """removes the least recently used files until the cache fits within max_size"""
+
+    entries = []
+    total_size = 0
+    with os.scandir(cache_path) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+    if total_size <= max_size:
+        return
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        # entries are stored as a pair of files sharing a key, remove both
+        base_path = os.path.splitext(path)[0]
+        for ext in (".json", ".body"):
+            try:
+                total_size -= os.path.getsize(base_path+ext)
+                os.remove(base_path+ext)
+            except OSError:
+                pass
+
+def parse_cache_control(value):
+    directives = {}
+    for directive in (value or "").split(","):
+        name, _, arg = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+
+    return directives
+
+# --- raw http responses ---
+def get_response(url):
+    """returns the cached response for a url, or None"""
+
+    cache_path = utils.get_cache_path("http")
+    key = _key(normalize_url(url))
+    meta_path = os.path.join(cache_path, key+".json")
+    body_path = os.path.join(cache_path, key+".body")
+
+    try:
+        with open(meta_path, "r") as f:
+            entry = json.load(f)
+        with open(body_path, "rb") as f:
+            entry["content"] = f.read()
+    except (OSError, ValueError):
+        return None
+
+    _touch(meta_path, body_path)
+    return entry
+
+def is_fresh(entry):
+    """checks if a cached response can be used without asking the server"""
+
+    directives = parse_cache_control(entry.get("cache_control"))
+    if "no-cache" in directives:
+        return False
+
+    try:
+        max_age = int(directives.get("max-age", 0))
+    except ValueError:
+        return False
+
+    return time.time() - entry["stored_at"] < max_age
+
+def conditional_headers(entry):
+    """returns the headers that turn a request into a revalidation of entry"""
+
+    headers = {}
+    if not entry:
+        return headers
+
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    return headers
+
+def store_response(url, fetched):
+    """stores a response from utils.http_fetch, if it's allowed to and it's complete"""
+
+    if (
+        "content" not in fetched or
+        fetched["truncated"] or
+        len(fetched["content"]) > HTTP_CACHE_MAX_ENTRY_SIZE or
+        "no-store" in parse_cache_control(fetched.get("cache_control"))
+    ):
+        return
+
+    cache_path = utils.get_cache_path("http")
+    key = _key(normalize_url(url))
+
+    entry = {
+        "url": normalize_url(url),
+        "stored_at": time.time(),
+        "content_type": fetched["content_type"],
+        "charset": fetched.get("charset"),
+        "content_length": fetched["content_length"],
+        "etag": fetched.get("etag"),
+        "last_modified": fetched.get("last_modified"),
+        "cache_control": fetched.get("cache_control"),
+        "checksum": fetched.get("checksum"),
+    }
+
+    try:
+        _write_atomic(os.path.join(cache_path, key+".body"), fetched["content"])
+        _write_atomic(os.path.join(cache_path, key+".json"), json.dumps(entry).encode())
+        _evict(cache_path, HTTP_CACHE_MAX_SIZE)
+    except OSError as e:
+        utils.console_log(f"couldn't write to http cache: {e}")
+
+def refresh_response(url, entry, fetched):
+    """updates a cached response after the server confirmed it's still valid (304)"""
+
+    cache_path = utils.get_cache_path("http")
+    key = _key(normalize_url(url))
+
+    entry = {k: v for k, v in entry.items() if k != "content"}
+    entry["stored_at"] = time.time()
+    # a 304 may come with updated caching headers
+    for header in ("etag", "last_modified", "cache_control"):
+        if fetched.get(header):
+            entry[header] = fetched[header]
+
+    try:
+        _write_atomic(os.path.join(cache_path, key+".json"), json.dumps(entry).encode())
+    except OSError as e:
+        utils.console_log(f"couldn't write to http cache: {e}")
+
+# --- processed output ---
+def get_processed(checksum, processor_name):
+    """returns the cached output of a processor for content with the given checksum, or None"""
+
+    path = os.path.join(utils.get_cache_path("processed"), _key(f"{processor_name}:{checksum}")+".json")
+
+    try:
+        with open(path, "r") as f:
+            output = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    _touch(path)
+    return output
+
+def store_processed(checksum, processor_name, output):
+    cache_path = utils.get_cache_path("processed")
+    path = os.path.join(cache_path, _key(f"{processor_name}:{checksum}")+".json")
+
+    try:
+        data = json.dumps(output).encode()
+    except (TypeError, ValueError):
+        # not everything a processor returns can be stored, that's fine
+        return
+
+    try:
+        _write_atomic(path, data)
+        _evict(cache_path, PROCESSED_CACHE_MAX_SIZE)
+    except OSError as e:
+        utils.console_log(f"couldn't write to processed cache: {e}")
+
+# --- thumbnails ---
+def get_thumbnail(checksum, size):
+    """returns the cached thumbnail of an image with the given checksum, or None"""
+
+    path = os.path.join(utils.get_cache_path("thumbnails"), _key(f"{checksum}:{size}")+".body")
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    _touch(path)
+    return data
+
+def store_thumbnail(checksum, size, data):
+    cache_path = utils.get_cache_path("thumbnails")
+    path = os.path.join(cache_path, _key(f"{checksum}:{size}")+".body")
+
+    try:
+        _write_atomic(path, data)
+        _evict(cache_path, THUMBNAIL_CACHE_MAX_SIZE)
+    except OSError as e:
+        utils.console_log(f"couldn't write to thumbnail cache: {e}")
+
+# --- search results ---
+def normalize_query(query):
+    """
+    normalizes a search query so that trivially different ways of writing it share a cache entry.
+    only case and whitespace, symbols like the + in "c++" or a leading - change what's searched for
+    """
+
+    return " ".join(query.lower().split())
+
+def get_search(engine, query):
+    """returns the cached results of a search, or None if there are none or they're too old"""
+
+    path = os.path.join(utils.get_cache_path("search"), _key(f"{engine}:{normalize_query(query)}")+".json")
+
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - entry["stored_at"] >= SEARCH_CACHE_TTL:
+        return None
+
+    _touch(path)
+    return entry["results"]
+
+def store_search(engine, query, results):
+    cache_path = utils.get_cache_path("search")
+    path = os.path.join(cache_path, _key(f"{engine}:{normalize_query(query)}")+".json")
+
+    entry = {
+        "query": query,
+        "stored_at": time.time(),
+        "results": results,
+    }
+
+    try:
+        _write_atomic(path, json.dumps(entry).encode())
+        _evict(cache_path, SEARCH_CACHE_MAX_SIZE)
+    except OSError as e:
+        utils.console_log(f"couldn't write to search cache: {e}")
+
+# --- youtube transcripts ---
+def get_transcript(video_id, language):
+    """returns the cached transcript of a video, or None"""
+
+    path = os.path.join(utils.get_cache_path("transcripts"), _key(f"{video_id}:{language}")+".json")
+
+    try:
+        with open(path, "r") as f:
+            transcript = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    _touch(path)
+    return transcript
+
+def store_transcript(video_id, language, transcript):
+    cache_path = utils.get_cache_path("transcripts")
+    path = os.path.join(cache_path, _key(f"{video_id}:{language}")+".json")
+
+    try:
+        _write_atomic(path, json.dumps(transcript).encode())
+        _evict(cache_path, TRANSCRIPT_CACHE_MAX_SIZE)
+    except OSError as e:
+        utils.console_log(f"couldn't write to transcript cache: {e}")
+
+# --- file checksums ---
+# a file with the same device, inode, size and modification time as last time is
+# assumed to be unchanged, so it doesn't need to be hashed again. usable by anything
+# that needs to know if two files are the same, not just the reader
+def _checksum_db():
+    db = sqlite3.connect(os.path.join(utils.get_cache_path(), "checksums.sqlite"), timeout=10)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS file_checksums (
+            device INTEGER,
+            inode INTEGER,
+            algorithm TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            checksum TEXT,
+            PRIMARY KEY (device, inode, algorithm)
+        )
+    """)
+    return db
+
+def get_file_checksum(path, algorithm="sha256"):
+    """returns the checksum of a local file, only hashing it if it changed since the last time"""
+
+    stat = os.stat(path)
+    key = (stat.st_dev, stat.st_ino, algorithm)
+
+    try:
+        with contextlib.closing(_checksum_db()) as db:
+            row = db.execute(
+                "SELECT size, mtime_ns, checksum FROM file_checksums WHERE device=? AND inode=? AND algorithm=?",
+                key,
+            ).fetchone()
+    except sqlite3.Error as e:
+        utils.console_log(f"couldn't read checksum cache: {e}")
+        row = None
+
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        return row[2]
+
+    checksum = utils.hash_file(path, algorithm)
+
+    # if it changed while we were hashing it, the checksum can't be trusted next time
+    if os.stat(path).st_mtime_ns != stat.st_mtime_ns:
+        return checksum
+
+    try:
+        with contextlib.closing(_checksum_db()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO file_checksums VALUES (?, ?, ?, ?, ?, ?)",
+                key + (stat.st_size, stat.st_mtime_ns, checksum),
+            )
+    except sqlite3.Error as e:
+        utils.console_log(f"couldn't write to checksum cache: {e}")
+
+    return checksum
@@ -0,0 +1,298 @@
+import os
+import threading
+
+import utils
+
+# an in-memory list of everything in the markdown database: type -> category -> entry.
+# it's built once, then kept up to date by watching the data folder for changes, so
+# listing and checking entries doesn't have to go through the filesystem every time.
+# the markdown files are still the source of truth, the catalog is only a copy
+
+# how often to rescan everything, in case the watcher missed something. in seconds
+CATALOG_RECONCILE_INTERVAL = 300
+
+ENTRY_EXTENSION = ".md"
+
+class Catalog:
+    def __init__(self, root, reserved=()):
+        self.root = root
+        self.reserved = tuple(reserved)
+
+        self._types = None
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._observer = None
+        self._stop = None
+
+    # --- building ---
+    def _scan_category(self, category_path):
+        entries = {}
+        with os.scandir(category_path) as it:
+            for entry in it:
+                if not entry.name.endswith(ENTRY_EXTENSION) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries[entry.name[:-len(ENTRY_EXTENSION)]] = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                }
+        return entries
+
+    def _scan_type(self, type_path):
+        categories = {}
+        with os.scandir(type_path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    categories[entry.name] = self._scan_category(entry.path)
+        return categories
+
+    def scan(self):
+        """rebuilds the whole catalog from the data folder"""
+
+        types = {}
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name in self.reserved or not entry.is_dir():
+                    continue
+                types[entry.name] = self._scan_type(entry.path)
+
+        with self._lock:
+            old_types = self._types
+            self._types = types
+
+        if old_types is not None:
+            # let anyone keeping their own copy know what changed while we weren't looking
+            self._notify(self._diff(old_types, types))
+
+    def _diff(self, old_types, new_types):
+        changed = []
+        for type_name in old_types.keys() | new_types.keys():
+            old_categories = old_types.get(type_name, {})
+            new_categories = new_types.get(type_name, {})
+            for category in old_categories.keys() | new_categories.keys():
+                old_entries = old_categories.get(category, {})
+                new_entries = new_categories.get(category, {})
+                for name in old_entries.keys() | new_entries.keys():
+                    if old_entries.get(name) != new_entries.get(name):
+                        changed.append((type_name, category, name))
+        return changed
+
+    def _ensure(self):
+        if self._types is None:
+            self.scan()
+        return self._types
+
+    # --- keeping it up to date ---
+    def _split(self, path):
+        """turns a path into (type, category, name), with None for the parts it doesn't go down to"""
+
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        if relative.startswith(os.pardir) or relative == os.curdir:
+            return None
+
+        parts = relative.split(os.sep)
+        if parts[0] in self.reserved or len(parts) > 3:
+            return None
+
+        parts += [None] * (3 - len(parts))
+        return tuple(parts)
+
+    def update_path(self, path):
+        """rereads whatever is at path (a type, category or entry) from disk"""
+
+        parts = self._split(path)
+        if not parts:
+            return
+
+        type_name, category, name = parts
+        if name is not None and not name.endswith(ENTRY_EXTENSION):
+            return
+
+        with self._lock:
+            types = self._ensure()
+
+            if category is None:
+                # a whole data type
+                old_categories = types.pop(type_name, {})
+                if os.path.isdir(path):
+                    types[type_name] = self._scan_type(path)
+                changed = self._diff(
+                    {type_name: old_categories},
+                    {type_name: types.get(type_name, {})},
+                )
+            elif name is None:
+                # a category
+                categories = types.get(type_name)
+                old_entries = categories.pop(category, {}) if categories else {}
+                if os.path.isdir(path):
+                    types.setdefault(type_name, {})[category] = self._scan_category(path)
+                changed = self._diff(
+                    {type_name: {category: old_entries}},
+                    {type_name: {category: types.get(type_name, {}).get(category, {})}},
+                )
+            else:
+                # a single entry
+                name = name[:-len(ENTRY_EXTENSION)]
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stat = None
+
+                entries = types.get(type_name, {}).get(category)
+                if stat is None:
+                    if entries is not None:
+                        entries.pop(name, None)
+                else:
+                    if entries is None:
+                        entries = types.setdefault(type_name, {}).setdefault(category, {})
+                    entries[name] = {
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                    }
+                changed = [(type_name, category, name)]
+
+        self._notify(changed)
+
+    def add_listener(self, listener):
+        """calls listener(changed) with a list of (type, category, name) whenever entries are created, changed or removed"""
+        self._listeners.append(listener)
+
+    def _notify(self, changed):
+        if not changed:
+            return
+        for listener in self._listeners:
+            try:
+                listener(changed)
+            except Exception as e:
+                utils.console_log(f"catalog listener failed: {e}")
+
+    def _reconcile(self):
+        while not self._stop.wait(CATALOG_RECONCILE_INTERVAL):
+            try:
+                self.scan()
+            except OSError as e:
+                utils.console_log(f"couldn't rescan the database: {e}")
+
+    def start(self):
+        """starts watching the data folder for changes. called when the server starts"""
+
+        if self._observer is not None:
+            return
+
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        catalog = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type not in ("created", "modified", "deleted", "moved"):
+                    return
+                # a folder counts as modified whenever something inside it changes, which we hear about anyway
+                if event.is_directory and event.event_type == "modified":
+                    return
+                catalog.update_path(event.src_path)
+                if event.event_type == "moved":
+                    catalog.update_path(event.dest_path)
+
+        self.scan()
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), self.root, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._reconcile, name="catalog-reconcile", daemon=True).start()
+
+    def stop(self):
+        """stops watching the data folder. called when the server shuts down"""
+
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    # --- looking things up ---
+    def get_types(self):
+        with self._lock:
+            return list(self._ensure())
+
+    def get_entries(self, type_name):
+        """returns {category: [entry names]} for a data type, or None if the type doesn't exist"""
+
+        with self._lock:
+            categories = self._ensure().get(type_name)
+            if categories is None:
+                return None
+            return {category: list(entries) for category, entries in categories.items()}
+
+    def has_type(self, type_name):
+        if type_name in self.reserved:
+            return False
+
+        with self._lock:
+            if type_name in self._ensure():
+                return True
+
+        # it might just be too new for the watcher to have noticed
+        path = os.path.join(self.root, type_name)
+        if os.path.isdir(path):
+            self.update_path(path)
+            return True
+        return False
+
+    def has_category(self, type_name, category):
+        with self._lock:
+            if category in self._ensure().get(type_name, {}):
+                return True
+
+        path = os.path.join(self.root, type_name, category)
+        if os.path.isdir(path):
+            self.update_path(path)
+            return True
+        return False
+
+    def get_entry(self, type_name, category, name):
+        """returns the size and modification time of an entry, or None if it doesn't exist"""
+
+        with self._lock:
+            info = self._ensure().get(type_name, {}).get(category, {}).get(name)
+            if info is not None:
+                return dict(info)
+
+        path = os.path.join(self.root, type_name, category, name+ENTRY_EXTENSION)
+        if not os.path.isfile(path):
+            return None
+
+        self.update_path(path)
+        with self._lock:
+            info = self._types.get(type_name, {}).get(category, {}).get(name)
+            return dict(info) if info is not None else None
+
+    def has_entry(self, type_name, category, name):
+        return self.get_entry(type_name, category, name) is not None
+
+    def iter_entries(self, type_name=None):
+        """yields (type, category, name, info) for every entry, or only the entries of one type"""
+
+        with self._lock:
+            types = self._ensure()
+            if type_name is not None:
+                types = {type_name: types.get(type_name, {})}
+
+            entries = [
+                (t, category, name, dict(info))
+                for t, categories in types.items()
+                for category, category_entries in categories.items()
+                for name, info in category_entries.items()
+            ]
+
+        return iter(entries)
+
+    def get_path(self, type_name, category, name=None):
+        if name is None:
+            return os.path.join(self.root, type_name, category)
+        return os.path.join(self.root, type_name, category, name+ENTRY_EXTENSION)
@@ -0,0 +1,239 @@
+import re
+
+# extracts the useful bits of a webpage in a single pass over the document.
+# uses the fastest html parser that's installed, beautifulsoup is always there as a fallback
+
+# common CSS classes and ids that hold the content, for pages without headers or paragraphs
+FALLBACK_CLASSES = (
+    "content",
+    "description",
+    "title",
+    "text",
+    "article",
+)
+FALLBACK_CLASSES_REGEX = re.compile(rf"\b({'|'.join(FALLBACK_CLASSES)})\b")
+
+HEADER_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+
+# lxml refuses text that still says which encoding its bytes were in
+XML_DECLARATION_REGEX = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+def decode(html, encoding=None):
+    """
+    turns the raw bytes of a page into text, the same way beautifulsoup always has:
+    a byte order mark wins, then the encoding the server sent (if any), then whatever
+    the page itself declares, then a guess. the fast parsers are only given text,
+    because they don't all look at <meta charset>
+    """
+
+    if isinstance(html, str):
+        return html
+
+    from bs4.dammit import UnicodeDammit
+
+    dammit = UnicodeDammit(html, user_encodings=[encoding] if encoding else [], is_html=True)
+    if dammit.unicode_markup is None:
+        return html.decode(errors="replace")
+
+    return dammit.unicode_markup
+
+def _walk_selectolax(html):
+    try:
+        from selectolax.lexbor import LexborHTMLParser as HTMLParser
+    except ImportError:
+        from selectolax.parser import HTMLParser
+
+    tree = HTMLParser(html)
+    for node in tree.root.traverse():
+        # text and comment nodes are named like "-text"
+        if node.tag.startswith("-"):
+            continue
+
+        attrs = node.attributes
+        yield (
+            node.tag,
+            attrs.get("class"),
+            attrs.get("id"),
+            attrs,
+            lambda node=node: node.text(deep=True),
+        )
+
+def _walk_lxml(html):
+    import lxml.html
+
+    root = lxml.html.fromstring(XML_DECLARATION_REGEX.sub("", html, count=1))
+    for element in root.iter():
+        # comments and processing instructions don't have a string tag
+        if not isinstance(element.tag, str):
+            continue
+
+        attrs = element.attrib
+        yield (
+            element.tag,
+            attrs.get("class"),
+            attrs.get("id"),
+            attrs,
+            element.text_content,
+        )
+
+def _walk_bs4(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup.find_all(True):
+        class_name = tag.get("class")
+        if isinstance(class_name, list):
+            class_name = " ".join(class_name)
+
+        yield (
+            tag.name,
+            class_name,
+            tag.get("id"),
+            tag.attrs,
+            tag.get_text,
+        )
+
+# fastest first
+BACKENDS = {
+    "selectolax": _walk_selectolax,
+    "lxml": _walk_lxml,
+    "bs4": _walk_bs4,
+}
+
+def available_backends():
+    """returns the names of the backends that can be imported, fastest first"""
+
+    import importlib.util
+
+    modules = {
+        "selectolax": "selectolax",
+        "lxml": "lxml.html",
+        "bs4": "bs4",
+    }
+
+    available = []
+    for name, module in modules.items():
+        try:
+            if importlib.util.find_spec(module):
+                available.append(name)
+        except ModuleNotFoundError:
+            pass
+
+    return available
+
+_default_backend = None
+
+def get_default_backend():
+    global _default_backend
+
+    if _default_backend is None:
+        backends = available_backends()
+        _default_backend = backends[0] if backends else "bs4"
+
+    return _default_backend
+
+def _dedupe(items):
+    # keeps the original order
+    return list(dict.fromkeys(items))
+
+def extract(html, backend=None, encoding=None):
+    """
+    scrapes a webpage in a single traversal.
+
+    returns the title, headers, paragraphs and image descriptions. if a page has no
+    headers or paragraphs, it falls back on elements with common content classes/ids,
+    and if even those don't exist, on the links in the page.
+    encoding is the charset the server sent, if html is still bytes.
+    """
+
+    backend = backend or get_default_backend()
+    html = decode(html, encoding)
+
+    title = None
+    headers = []
+    paragraphs = []
+    images = []
+    urls = []
+    # elements that might be needed by the fallback, only looked at if it's needed
+    candidates = []
+
+    try:
+        elements = list(BACKENDS[backend](html))
+    except Exception:
+        if backend == "bs4":
+            raise
+        # the fast parsers are stricter about broken input than beautifulsoup is
+        return extract(html, backend="bs4")
+
+    for tag, class_name, id_name, attrs, get_text in elements:
+        if tag == "title":
+            if title is None:
+                title = get_text().strip()
+        elif tag in HEADER_TAGS:
+            headers.append(get_text().strip())
+        elif tag == "p":
+            paragraphs.append(get_text().strip())
+        elif tag == "img":
+            if attrs.get("alt"):
+                images.append(attrs.get("alt"))
+        elif tag == "a":
+            if attrs.get("href") is not None:
+                urls.append(attrs.get("href"))
+
+        if class_name or id_name:
+            candidates.append((class_name, id_name, get_text))
+
+    output = {}
+
+    # we can usually get plenty of information from just the title, headers and paragraphs of a page!
+    if title is not None:
+        output["title"] = title
+    if headers:
+        output["headers"] = _dedupe(headers)
+    if paragraphs:
+        output["paragraphs"] = _dedupe(paragraphs)
+    if images:
+        output["images"] = _dedupe(images)
+
+    if headers or paragraphs:
+        return output
+
+    # but not always...
+    # if nothing was found, first, fall back on common CSS classes and ids
+    by_class = {class_name: [] for class_name in FALLBACK_CLASSES}
+    by_id = {class_name: [] for class_name in FALLBACK_CLASSES}
+    for class_name, id_name, get_text in candidates:
+        matched_classes = set(FALLBACK_CLASSES_REGEX.findall(class_name or ""))
+        matched_ids = set(FALLBACK_CLASSES_REGEX.findall(id_name or ""))
+        if not matched_classes and not matched_ids:
+            continue
+
+        text = get_text()
+        if text == "":
+            continue
+
+        for match in matched_classes:
+            by_class[match].append(text)
+        for match in matched_ids:
+            by_id[match].append(text)
+
+    classes = {}
+    for class_name in FALLBACK_CLASSES:
+        found = _dedupe(by_class[class_name] + by_id[class_name])
+        if found:
+            classes[class_name] = found
+
+    if classes:
+        output["classes"] = classes
+        return output
+
+    # still nothing?
+    # then fall back on links if nothing could be extracted from the other html elements.
+    # this is a last resort because it tends to be a lot of data to process
+    if urls:
+        output["urls"] = _dedupe(urls)
+    else:
+        # alright, theres no saving this one. at least we have a title!
+        output["message"] = "nothing could be scraped from the page!"
+
+    return output
@@ -1,11 +1,43 @@
 #!/usr/bin/python
 
+import contextlib
 import fastmcp
 import mcp_tools
+from mcp_tools import markdown_db
+import utils
+import workers
+import monitor
+
+# how many sessions are using the lifespan right now. over http, fastmcp enters it once
+# per session, and the shared resources have to outlive every one of them
+_sessions = 0
+
+@contextlib.asynccontextmanager
+async def lifespan(server):
+    # anything that has to live as long as the server goes here
+    global _sessions
+
+    if _sessions == 0:
+        workers.start_pool()
+        monitor.start()
+        markdown_db.start()
+    _sessions += 1
+    try:
+        yield
+    finally:
+        _sessions -= 1
+        if _sessions == 0:
+            # the last session is gone
+            markdown_db.stop()
+            monitor.stop()
+            workers.shutdown_pool()
+            await utils.close_http_session()
 
 if __name__ == "__main__":
     print("starting server..")
-    mcp = fastmcp.FastMCP("tools")
+    mcp = fastmcp.FastMCP("tools", lifespan=lifespan)
+    # lets the event loop monitor tell which tool caused a stall
+    mcp.add_middleware(monitor.ToolNameMiddleware())
 
     # register all the tools from throughout the project into the MCP server
     mcp_tools.register_mcp(mcp)
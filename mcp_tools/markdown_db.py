@@ -1,21 +1,266 @@
 import os
 import shutil
 import utils
+import re
+import asyncio
+import contextlib
+import catalog
+import search_index
 import datetime
 
 DATA_PATH = utils.get_data_path()
 
+# folders inside the data folder that aren't data types
+RESERVED_DIRS = ("trash", "cache")
+
+# what's in the database, kept in memory so listing and checking entries is fast
+CATALOG = catalog.Catalog(DATA_PATH, RESERVED_DIRS)
+
+# full-text index of everything in the database, kept next to the data folder
+INDEX = search_index.SearchIndex(DATA_PATH+"_index.sqlite")
+# every change the catalog sees is passed on to the index
+CATALOG.add_listener(lambda changed: INDEX.update(CATALOG, changed))
+
+def start():
+    """starts keeping the catalog and index up to date. called when the server starts"""
+    import threading
+
+    CATALOG.start()
+    # catching up on changes made while the server wasn't running can take a while.
+    # searches go through the files until it's done
+    threading.Thread(target=INDEX.sync, args=(CATALOG,), name="index-sync", daemon=True).start()
+
+def stop():
+    CATALOG.stop()
+
+# what db_bulk_* tools can do with an entry
+BULK_ACTIONS = ("create", "read", "edit", "delete")
+
+# how many search results are returned at once, unless asked otherwise
+SEARCH_LIMIT = 10
+# how many snippets to show per result, and how many characters around each match
+SNIPPET_COUNT = 3
+SNIPPET_CONTEXT = 60
+
+# searches that can't use the index read this many files at the same time
+SCAN_WORKERS = 8
+# files bigger than this are searched through mmap instead of being read into memory
+SCAN_MMAP_SIZE = 1024 * 1024
+
+def compile_query(query: str, regex: bool = False, case_sensitive: bool = False):
+    """turns a search query into a regex. raises an exception if it's an invalid regex"""
+
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        return re.compile(query if regex else re.escape(query), flags)
+    except re.error as e:
+        raise Exception(f"invalid regex: {e}")
+
+def highlight_text(content: str, pattern) -> str:
+    """marks every match of pattern in content, the same way the index does"""
+
+    def mark(match):
+        if not match.group(0):
+            return match.group(0)
+        return search_index.MARK_START+match.group(0)+search_index.MARK_END
+
+    return pattern.sub(mark, content)
+
+def _scan_file(path: str, pattern, bytes_pattern) -> bool:
+    if bytes_pattern is not None and os.path.getsize(path) > SCAN_MMAP_SIZE:
+        import mmap
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return bytes_pattern.search(m) is not None
+
+    with open(path, 'r', errors="replace") as f:
+        return pattern.search(f.read()) is not None
+
+def _bytes_pattern(pattern):
+    """
+    large files are searched as bytes, so the pattern has to be bytes too. that only matches the
+    same things for plain ascii text: bytes patterns ignore case and find words for ascii letters
+    only, so "äpfel" wouldn't find "ÄPFEL", and "." matches a single byte instead of a character.
+    returns None if the pattern has to be searched as text
+    """
+
+    literal = re.sub(r"\\(.)", r"\1", pattern.pattern, flags=re.DOTALL)
+    if not pattern.pattern.isascii() or re.escape(literal) != pattern.pattern:
+        # not ascii, or actual regex syntax
+        return None
+
+    try:
+        return re.compile(pattern.pattern.encode(), pattern.flags & ~re.UNICODE)
+    except re.error:
+        return None
+
+def scan_entries(entries: list, pattern, needed: int = None):
+    """
+    searches the content of entries (type, category, name) for pattern, a few files at a time.
+    stops once `needed` matches are found. returns the matching entries in their original order,
+    and whether every entry was searched. entries that can't be read count as a match,
+    so their error shows up in the results
+    """
+    import collections
+    import concurrent.futures
+
+    entries = list(entries)
+    if needed is not None and needed <= 0:
+        return [], not entries
+
+    bytes_pattern = _bytes_pattern(pattern)
+
+    matches = []
+    in_flight = collections.deque()
+    remaining = iter(entries)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        def submit_next():
+            entry = next(remaining, None)
+            if entry is not None:
+                path = CATALOG.get_path(*entry)
+                in_flight.append((entry, pool.submit(_scan_file, path, pattern, bytes_pattern)))
+
+        # keep a few more files going than there are threads, so they never wait for work
+        for _ in range(SCAN_WORKERS*2):
+            submit_next()
+
+        while in_flight:
+            entry, future = in_flight.popleft()
+            try:
+                matched = future.result()
+            except Exception:
+                matched = True
+
+            if matched:
+                matches.append(entry)
+                if needed is not None and len(matches) >= needed:
+                    # that's all we need, don't bother with the rest
+                    complete = not in_flight and next(remaining, None) is None
+                    for _, future in in_flight:
+                        future.cancel()
+                    return matches, complete
+
+            submit_next()
+
+    return matches, True
+
+def make_snippets(highlighted: str):
+    """returns how many matches there are in highlighted text, and a few snippets around them with the matches in **bold**"""
+
+    start_mark, end_mark = search_index.MARK_START, search_index.MARK_END
+
+    count = highlighted.count(start_mark)
+    snippets = []
+    covered = 0
+
+    position = highlighted.find(start_mark)
+    while position != -1 and len(snippets) < SNIPPET_COUNT:
+        if position < covered:
+            # already part of the previous snippet
+            position = highlighted.find(start_mark, position+1)
+            continue
+
+        start = max(covered, position-SNIPPET_CONTEXT)
+        end = highlighted.find(end_mark, position)
+        end = len(highlighted) if end == -1 else end+1
+        end = min(len(highlighted), end+SNIPPET_CONTEXT)
+
+        # don't cut a match in half
+        last_start = highlighted.rfind(start_mark, start, end)
+        if highlighted.find(end_mark, last_start, end) == -1:
+            end = highlighted.find(end_mark, last_start)+1
+
+        text = highlighted[start:end].replace(start_mark, "**").replace(end_mark, "**")
+        text = " ".join(text.split())
+        if start > 0:
+            text = "..."+text
+        if end < len(highlighted):
+            text += "..."
+
+        snippets.append(text)
+        covered = end
+        position = highlighted.find(start_mark, end)
+
+    return count, snippets
+
+def search_results(
+    matches: list,
+    query: str,
+    limit: int,
+    offset: int,
+    include_content: int,
+    pattern=None,
+    complete: bool = True,
+) -> dict:
+    """
+    turns a list of matching entries into a page of search results, with snippets around the matches.
+    matches are dicts with a type, category, name, and id if they came from the index.
+    only the entries on the page are read. if the search stopped early, complete is false
+    """
+
+    limit = limit or SEARCH_LIMIT
+    offset = offset or 0
+    include_content = include_content or 0
+    pattern = pattern or compile_query(query)
+
+    page = matches[offset:offset+limit]
+    highlighted = INDEX.highlight([match["id"] for match in page if match.get("id") is not None], query)
+
+    results = []
+    for i, match in enumerate(page):
+        result = {
+            "type": match["type"],
+            "category": match["category"],
+            "name": match["name"],
+        }
+
+        try:
+            content = open(CATALOG.get_path(match["type"], match["category"], match["name"]), 'r').read()
+        except Exception as e:
+            result["error"] = str(e)
+            results.append(result)
+            continue
+
+        text = highlighted.get(match.get("id"))
+        if text is None:
+            text = highlight_text(content, pattern)
+
+        result["matches"], result["snippets"] = make_snippets(text)
+        if not result["snippets"]:
+            # matched by name only, so show the start of it
+            preview = " ".join(content[:SNIPPET_CONTEXT*2].split())
+            result["snippets"] = [preview+("..." if len(content) > SNIPPET_CONTEXT*2 else "")]
+
+        if i < include_content:
+            result["content"] = content
+
+        results.append(result)
+
+    output = {
+        "total": len(matches),
+        "offset": offset,
+        "results": results,
+    }
+    if not complete:
+        # the search stopped once it had enough, there might be more
+        output["partial"] = True
+    if offset+limit < len(matches):
+        output["next_cursor"] = utils.encode_cursor({"offset": offset+limit})
+
+    return utils.result(output)
+
 def filter_data_path(type_name_plural: str, category: str, name: str):
     name = utils.strip_filename(name).replace(".md", "")
     category = utils.strip_filename(category)
 
-    if type_name_plural == "trash":
-        raise Exception("trash is not a data type!")
+    if type_name_plural in RESERVED_DIRS:
+        raise Exception(f"{type_name_plural} is not a data type!")
 
-    if not os.path.exists(os.path.join(DATA_PATH, type_name_plural, category)):
+    if not CATALOG.has_category(type_name_plural, category):
         raise Exception("invalid category "+os.path.join(DATA_PATH, type_name_plural, category))
 
-    if not os.path.exists(os.path.join(DATA_PATH, type_name_plural, category, name+".md")):
+    if not CATALOG.has_entry(type_name_plural, category, name):
         raise Exception("entry does not exist")
 
     return (name, category)
@@ -47,41 +292,26 @@ def register_mcp(mcp):
         name = utils.strip_filename(name)
         category = utils.strip_filename(category)
 
-        if not os.path.exists(data_type_path):
-            os.mkdir(data_type_path)
-
-        if not os.path.exists(os.path.join(data_type_path, category)):
-            os.mkdir(os.path.join(data_type_path, category))
+        if not CATALOG.has_category(type_name_plural, category):
+            os.makedirs(os.path.join(data_type_path, category), exist_ok=True)
 
         entry_path = os.path.join(data_type_path, category, name+".md")
 
-        if os.path.exists(entry_path):
+        if CATALOG.has_entry(type_name_plural, category, name):
             return utils.result(None, f"{name} already exists! you should read it and then edit it instead.")
 
         with open(entry_path, 'w') as f:
             f.write(content)
+        # don't wait for the watcher to notice
+        CATALOG.update_path(entry_path)
 
         return utils.result(True)
 
     def get_data_entries(type_name_plural: str) -> dict:
-        results = {}
-
-        type_path = os.path.join(DATA_PATH, type_name_plural)
-        if not os.path.exists(type_path):
+        results = CATALOG.get_entries(type_name_plural)
+        if results is None:
             return utils.result(None, f"invalid data type: {type_name_plural}")
 
-
-        for category in os.listdir(
-            os.path.join(DATA_PATH, type_name_plural)
-        ):
-            results[category] = []
-
-            for filename in os.listdir(
-                os.path.join(DATA_PATH, type_name_plural, category)
-            ):
-                if filename.endswith(".md"):
-                    results[category].append(filename.replace(".md", ""))
-                
         return utils.result(results)
 
     def rename_data_category(type_name_plural: str, category: str, category_new: str) -> dict:
@@ -89,26 +319,31 @@ def register_mcp(mcp):
         category_new = utils.strip_filename(category_new)
 
         """rename a category"""
-        if not os.path.exists(os.path.join(DATA_PATH, type_name_plural, category)):
+        if not CATALOG.has_category(type_name_plural, category):
             return utils.result(None, "no such category!")
 
         try:
             shutil.move(os.path.join(DATA_PATH, type_name_plural, category), os.path.join(DATA_PATH, type_name_plural, category_new))
         except Exception as e:
             return utils.result(None, e)
+        finally:
+            CATALOG.update_path(os.path.join(DATA_PATH, type_name_plural, category))
+            CATALOG.update_path(os.path.join(DATA_PATH, type_name_plural, category_new))
 
         return utils.result(True)
     
     def delete_data_category(type_name_plural: str, category: str) -> dict:
         category = utils.strip_filename(category)
 
-        if not os.path.exists(os.path.join(DATA_PATH, type_name_plural, category)):
+        if not CATALOG.has_category(type_name_plural, category):
             return utils.result(None, "no such category!")
 
         try:
             shutil.rmtree(os.path.join(DATA_PATH, type_name_plural, category))
         except Exception as e:
             return utils.result(e)
+        finally:
+            CATALOG.update_path(os.path.join(DATA_PATH, type_name_plural, category))
 
         return utils.result(True)
 
@@ -133,9 +368,11 @@ def register_mcp(mcp):
 
         name, category = filter_data_path(type_name_plural, category, name)
 
-        with open(os.path.join(DATA_PATH, type_name_plural, category, name+".md"), 'w') as f:
+        entry_path = os.path.join(DATA_PATH, type_name_plural, category, name+".md")
+        with open(entry_path, 'w') as f:
             f.write(content)
             f.write("\n")
+        CATALOG.update_path(entry_path)
         
         return utils.result(True)
     
@@ -145,72 +382,244 @@ def register_mcp(mcp):
         utils.console_log(f"deleting {name} of type {type_name_plural}")
 
         name, category = filter_data_path(type_name_plural, category, name)
-        os.remove(os.path.join(DATA_PATH, type_name_plural, category, name+".md"))
+        entry_path = os.path.join(DATA_PATH, type_name_plural, category, name+".md")
+        os.remove(entry_path)
+        CATALOG.update_path(entry_path)
         return utils.result(True)
 
-    def search_in_data(type_name_plural: str, query: str) -> dict:
+    def bulk_data_entries(type_name_plural: str, operations: list) -> dict:
+        """
+        runs a list of create, read, edit and delete operations in one go.
+        every operation gets its own status. new content is written to temporary files first,
+        which are then all renamed into place, so no entry is ever left half-written
+        """
+
+        utils.console_log(f"running {len(operations)} operations on {type_name_plural}")
+
+        results = [None] * len(operations)
+        # (index, action, final path, content) for every write
+        writes = []
+        deletes = []
+        reads = []
+        seen = set()
+
+        # first check everything, without touching the filesystem
+        for i, operation in enumerate(operations):
+            action = str(operation.get("action", "")).lower()
+            results[i] = {
+                "action": action,
+                "category": operation.get("category"),
+                "name": operation.get("name"),
+            }
+
+            try:
+                if action not in BULK_ACTIONS:
+                    raise Exception(f"action must be one of: {', '.join(BULK_ACTIONS)}")
+                if not operation.get("category") or not operation.get("name"):
+                    raise Exception("category and name are required")
+
+                if action == "create":
+                    name = utils.strip_filename(operation["name"])
+                    category = utils.strip_filename(operation["category"])
+                    if CATALOG.has_entry(type_name_plural, category, name):
+                        raise Exception(f"{name} already exists! you should read it and then edit it instead.")
+                else:
+                    name, category = filter_data_path(type_name_plural, operation["category"], operation["name"])
+
+                if (category, name) in seen:
+                    raise Exception(f"{name} is already part of this batch")
+                seen.add((category, name))
+
+                entry_path = os.path.join(DATA_PATH, type_name_plural, category, name+".md")
+
+                if action in ("create", "edit"):
+                    content = operation.get("content")
+                    if content is None:
+                        raise Exception("content is required")
+                    # edits have always ended with a newline
+                    writes.append((i, action, entry_path, content+"\n" if action == "edit" else content))
+                elif action == "delete":
+                    deletes.append((i, entry_path))
+                else:
+                    reads.append((i, entry_path))
+
+                results[i].update(category=category, name=name)
+            except Exception as e:
+                results[i].update(status="error", error=str(e))
+
+        import tempfile
+
+        # stage all the writes next to where they'll end up. every call gets its own
+        # temporary files, so two batches writing the same entry can't mix them up
+        staged = []
+        for i, action, entry_path, content in writes:
+            try:
+                os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(entry_path))
+                # mkstemp makes files only we can read, entries have always been readable by others
+                os.chmod(tmp_path, 0o644)
+                with open(fd, 'w') as f:
+                    f.write(content)
+                staged.append((i, action, tmp_path, entry_path))
+            except Exception as e:
+                results[i].update(status="error", error=str(e))
+
+        # then put them in place, each in one step
+        for i, action, tmp_path, entry_path in staged:
+            try:
+                if action == "create":
+                    # a link fails if the entry showed up in the meantime, instead of overwriting it
+                    try:
+                        os.link(tmp_path, entry_path)
+                    except FileExistsError:
+                        raise Exception(f"{os.path.basename(entry_path)[:-3]} already exists! you should read it and then edit it instead.")
+                else:
+                    os.replace(tmp_path, entry_path)
+                results[i]["status"] = "success"
+            except Exception as e:
+                results[i].update(status="error", error=str(e))
+            finally:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+        for i, entry_path in deletes:
+            try:
+                os.remove(entry_path)
+                results[i]["status"] = "success"
+            except Exception as e:
+                results[i].update(status="error", error=str(e))
+
+        for i, entry_path in reads:
+            try:
+                with open(entry_path, 'r') as f:
+                    results[i]["content"] = f.read()
+                results[i]["status"] = "success"
+            except Exception as e:
+                results[i].update(status="error", error=str(e))
+
+        for i, action, tmp_path, entry_path in staged:
+            CATALOG.update_path(entry_path)
+        for i, entry_path in deletes:
+            CATALOG.update_path(entry_path)
+
+        failed = sum(1 for result in results if result["status"] == "error")
+        return utils.result({
+            "succeeded": len(results)-failed,
+            "failed": failed,
+            "results": results,
+        })
+
+    def search_in_data(
+        type_name_plural: str,
+        query: str,
+        limit: int = SEARCH_LIMIT,
+        offset: int = 0,
+        cursor: str = None,
+        include_content: int = 0,
+        regex: bool = False,
+        case_sensitive: bool = False,
+    ) -> dict:
         """searches a given data type for a given query across all its categories"""
 
         utils.console_log(f"searching {type_name_plural} for {query}")
 
-        query = utils.strip_filename(query)
-
-        results = []
-        for category in os.listdir(os.path.join(DATA_PATH, type_name_plural)):
-            for entry_filename in os.listdir(os.path.join(DATA_PATH, type_name_plural, category)):
-                entry_name = os.path.splitext(entry_filename)[0]
-                entry_content = open(os.path.join(DATA_PATH, type_name_plural, category, entry_filename)).read()
-
-                if query in entry_name or query in entry_content:
-                    results.append({"category": category, "name": entry_name, "content": entry_content})
+        if cursor:
+            offset = utils.decode_cursor(cursor)["offset"]
+        limit = limit or SEARCH_LIMIT
+        offset = offset or 0
+
+        pattern = compile_query(query, regex, case_sensitive)
+        name_query = utils.strip_filename(query)
+
+        def name_matches(entry_name):
+            return pattern.search(entry_name) if regex else name_query in entry_name
+
+        # the index only knows about whole words, regardless of case
+        hits = INDEX.search(query, type_name_plural) if not regex and not case_sensitive else None
+
+        matches = []
+        complete = True
+        if hits is not None:
+            for entry_id, _, category, entry_name in hits:
+                matches.append({"id": entry_id, "type": type_name_plural, "category": category, "name": entry_name})
+
+            # the index matches whole words, names can still be matched partially like before
+            matched = {(match["category"], match["name"]) for match in matches}
+            for _, category, entry_name, info in CATALOG.iter_entries(type_name_plural):
+                if name_matches(entry_name) and (category, entry_name) not in matched:
+                    matches.append({"type": type_name_plural, "category": category, "name": entry_name})
+        else:
+            # no index (yet), so go through the files. matching names don't need to be read
+            entries = [(t, category, name) for t, category, name, info in CATALOG.iter_entries(type_name_plural)]
+            by_name = [entry for entry in entries if name_matches(entry[2])]
+            by_content, complete = scan_entries(
+                [entry for entry in entries if not name_matches(entry[2])],
+                pattern,
+                # one more than needed, to know if there's another page
+                max(0, offset+limit+1-len(by_name)),
+            )
+            for t, category, name in by_name + by_content:
+                matches.append({"type": t, "category": category, "name": name})
 
-        return utils.result(results)
+        return search_results(matches, query, limit, offset, include_content, pattern, complete)
 
     @mcp.tool()
-    def search_entire_database(query: str, search_within_content: bool) -> dict:
+    def search_entire_database(
+        query: str,
+        search_within_content: bool,
+        limit: int = SEARCH_LIMIT,
+        offset: int = 0,
+        cursor: str = None,
+        include_content: int = 0,
+        regex: bool = False,
+        case_sensitive: bool = False,
+    ) -> dict:
         """
         searches across all data types and categories for a specified query.
         if search_within_content is true, it will search inside every file. otherwise it will only search by name.
         searching by name is faster!
+        content searches match whole words, best match first. every word has to match, unless there's an OR between them. put "quotes" around words to match them as a phrase.
+        set "regex" to true to search with a regular expression instead, and "case_sensitive" to true to only match the exact case. those searches are slower.
+
+        results come with the number of matches and snippets around them, not the whole entry.
+        use "limit" and "offset" to page through the results, or pass the "next_cursor" of a result as "cursor" to get the next page.
+        use "include_content" to also get the full content of the first that many results.
+        if a result has "partial" set, the search stopped once it found enough, so there may be more than "total".
         """
 
-        results = []
-
-        for type_name_plural in os.listdir(DATA_PATH):
-            for category in os.listdir(os.path.join(DATA_PATH, type_name_plural)):
-                for filename in os.listdir(os.path.join(DATA_PATH, type_name_plural, category)):
-                    if search_within_content:
-                        try:
-                            content = open(os.path.join(DATA_PATH, type_name_plural, category, filename), 'r').read()
-                            if query in content:
-                                results.append({
-                                    "type": type_name_plural,
-                                    "category": category,
-                                    "name": filename,
-                                    "content": content
-                                })
-                        except Exception as e:
-                            results.append({
-                                "type": type_name_plural,
-                                "category": category,
-                                "name": filename,
-                                "error": e
-                            })
-                    else:
-                        if utils.strip_filename(query) in filename:
-                            try:
-                                content = open(os.path.join(DATA_PATH, type_name_plural, category, filename), 'r').read()
-                            except:
-                                content = None
-
-                            results.append({
-                                "type": type_name_plural,
-                                "category": category,
-                                "name": filename,
-                                "content": content
-                            })
+        if cursor:
+            offset = utils.decode_cursor(cursor)["offset"]
+        limit = limit or SEARCH_LIMIT
+        offset = offset or 0
+
+        pattern = compile_query(query, regex, case_sensitive)
+
+        matches = []
+        complete = True
+
+        hits = None
+        if search_within_content and not regex and not case_sensitive:
+            hits = INDEX.search(query)
+
+        if hits is not None:
+            for entry_id, type_name_plural, category, name in hits:
+                matches.append({"id": entry_id, "type": type_name_plural, "category": category, "name": name})
+        elif search_within_content:
+            entries, complete = scan_entries(
+                [(t, category, name) for t, category, name, info in CATALOG.iter_entries()],
+                pattern,
+                # one more than needed, to know if there's another page
+                offset+limit+1,
+            )
+            for type_name_plural, category, name in entries:
+                matches.append({"type": type_name_plural, "category": category, "name": name})
+        else:
+            name_query = utils.strip_filename(query)
+            for type_name_plural, category, name, info in CATALOG.iter_entries():
+                if (pattern.search(name) if regex else name_query in name+".md"):
+                    matches.append({"type": type_name_plural, "category": category, "name": name})
 
-        return utils.result(results)
+        return search_results(matches, query, limit, offset, include_content, pattern, complete)
 
     # ------
     # now for the secret sauce!
@@ -224,8 +633,9 @@ def register_mcp(mcp):
         """
 
         # create the folder for this data type
-        if not os.path.exists(os.path.join(DATA_PATH, type_name_plural)):
+        if not CATALOG.has_type(type_name_plural):
             os.mkdir(os.path.join(DATA_PATH, type_name_plural))
+            CATALOG.update_path(os.path.join(DATA_PATH, type_name_plural))
 
         # create wrapper function for: get data entries
         def _get_data_entries(_type=type_name_plural) -> dict:
@@ -284,14 +694,46 @@ please use markdown format!
             description=f"deletes a {type_name_singular} by name",
             exclude_args=["_type"]
         )
+
+        # many entries at once
+        def _bulk_data_entries(operations: list[dict], _type=type_name_plural) -> dict:
+            return bulk_data_entries(_type, operations)
+        mcp.tool(
+            _bulk_data_entries,
+            name=f"db_bulk_{type_name_plural}",
+            description=f"""
+creates, reads, edits and deletes many {type_name_plural} in one call. use this instead of calling the other {type_name_singular} tools over and over!
+"operations" is a list of objects with:
+- "action": "create", "read", "edit" or "delete"
+- "category" and "name" of the {type_name_singular}
+- "content": the content for create and edit. please use markdown format! {additional_instructions}
+returns the status of every operation, and the content of every {type_name_singular} that was read.
+        """,
+            exclude_args=["_type"]
+        )
         
         # search for entry
-        def _search_in_data(query: str, _type=type_name_plural) -> dict:
-            return search_in_data(_type, query)
+        def _search_in_data(
+            query: str,
+            limit: int = SEARCH_LIMIT,
+            offset: int = 0,
+            cursor: str = None,
+            include_content: int = 0,
+            regex: bool = False,
+            case_sensitive: bool = False,
+            _type=type_name_plural,
+        ) -> dict:
+            return search_in_data(_type, query, limit, offset, cursor, include_content, regex, case_sensitive)
         mcp.tool(
             _search_in_data,
             name=f"db_search_{type_name_plural}",
-            description=f"searches within the name and contents of all stored {type_name_plural} for your given query",
+            description=f"""
+searches within the name and contents of all stored {type_name_plural} for your given query.
+returns the number of matches and snippets around them for every {type_name_singular}, not the whole {type_name_singular}.
+use "limit" and "offset" to page through the results, or pass the "next_cursor" of a result as "cursor" to get the next page.
+use "include_content" to also get the full content of the first that many results.
+set "regex" to true to search with a regular expression, and "case_sensitive" to true to only match the exact case. those searches are slower.
+        """,
             exclude_args=["_type"]
         )
 
@@ -315,14 +757,22 @@ please use markdown format!
             exclude_args=["_type"]
         )
 
+    @mcp.tool()
+    async def rebuild_database_index() -> dict:
+        """rebuilds the search index of the database from the files. only needed if searches seem to miss things"""
+
+        utils.console_log("rebuilding search index..")
+
+        if not INDEX.is_available():
+            return utils.result(None, "full-text search isn't available in this version of sqlite")
+
+        await asyncio.to_thread(INDEX.rebuild, CATALOG)
+        return utils.result(True)
+
     @mcp.tool()
     def get_data_types():
         """lists all available data entry types"""
-        return utils.result([
-            name for name
-            in os.listdir(DATA_PATH)
-            if name not in ("trash")
-        ])
+        return utils.result(CATALOG.get_types())
 
     # ------------
     # add data types here!
@@ -1,4 +1,8 @@
 import utils
+import cache
+import html_extract
+import workers
+import ranking
 
 import os
 import datetime
@@ -7,178 +11,619 @@ import asyncio
 import aiohttp
 import urllib
 import json
+import io
+import mmap
+import hashlib
+import contextlib
+
+from fastmcp import Context
+
+# ----------------------
+# --- PROCESSOR REGISTRY ---
+# ----------------------
+# every processor registers itself with the @processor decorator, declaring which
+# file extensions, mime types and magic bytes it handles, how much of a file it
+# needs and whether it's heavy on the CPU. the lookup tables are built once at import.
+
+MB = 1024 * 1024
+
+# the amount of bytes needed to sniff a file's type
+SNIFF_SIZE = 4096
+# magic signatures shorter than this aren't trusted over a text or image extension
+MAGIC_MIN_TRUSTED_SIZE = 4
+
+PROCESSORS = {}
+EXTENSION_MAP = {}
+MIMETYPE_MAP = {}
+MAGIC_SIGNATURES = []
+
+def processor(
+    extensions=(),
+    mimetypes=(),
+    magic=(),
+    max_bytes=None,
+    spool=False,
+    tail_bytes=0,
+    cpu_heavy=False,
+    takes_path=False,
+    options=(),
+):
+    """
+    registers a function as a processor.
+
+    magic is a list of (offset, bytes) signatures that identify the format.
+    max_bytes is how much of a remote file the processor needs (None for all of it),
+    spool makes the fetcher write it to disk instead of keeping it in memory.
+    tail_bytes is how much of the end of a spooled file the processor also needs, if it got cut off.
+    cpu_heavy processors shouldn't run on the event loop.
+    takes_path processors open local files themselves, instead of getting their content.
+    options are the extra keyword arguments (from the tool call or a cursor) the processor accepts.
+    """
+
+    def decorator(func):
+        PROCESSORS[func] = {
+            "name": func.__name__,
+            "extensions": extensions,
+            "mimetypes": mimetypes,
+            "magic": magic,
+            "max_bytes": max_bytes,
+            "spool": spool,
+            "tail_bytes": tail_bytes,
+            "cpu_heavy": cpu_heavy,
+            "takes_path": takes_path,
+            "options": options,
+        }
 
-async def process_webpage(html):
-    # uses beautifulsoup to scrape a webpage
+        for ext in extensions:
+            EXTENSION_MAP[ext] = func
+        for mimetype in mimetypes:
+            MIMETYPE_MAP[mimetype] = func
+        for offset, signature in magic:
+            MAGIC_SIGNATURES.append((offset, signature, func))
 
-    output = {}
+        return func
 
-    import re
-    from bs4 import BeautifulSoup
+    return decorator
+
+def get_processor_for_mimetype(content_type):
+    if not content_type:
+        return None
+
+    # exact matches first, then the general kind of content (text/*, image/*, ...)
+    return (
+        MIMETYPE_MAP.get(content_type) or
+        MIMETYPE_MAP.get(content_type.split("/")[0]+"/*")
+    )
+
+def sniff_processor(head, claimed=None):
+    """
+    figures out the processor from the first bytes of a file. returns None if it can't tell.
+    claimed is the processor the extension or mime type points to, if any
+    """
+
+    for offset, signature, func in MAGIC_SIGNATURES:
+        if head[offset:offset+len(signature)] == signature:
+            if len(signature) < MAGIC_MIN_TRUSTED_SIZE and claimed in (process_text, process_image):
+                # a couple of bytes like "MZ" can start a text file just by chance
+                continue
+            if func == process_gzip and is_gzipped_tar(head):
+                return process_tar
+            return func
+
+    # text formats don't have magic bytes, but html is easy to recognize
+    start = head[:256].lstrip().lower()
+    if start.startswith((b"<!doctype html", b"<html")):
+        return process_webpage
 
-    soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
+    return None
+
+def is_gzipped_tar(head):
+    import zlib
 
-    # we can usually get plenty of information from just the title, headers and paragraphs of a page!
     try:
-        output["title"] = soup.find("title").get_text().strip()
-    except AttributeError:
-        # no title found
-        pass
-
-    output["headers"] = []
-    for header in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-        output["headers"].append(header.get_text().strip())
-    if not output["headers"]:
-        del output["headers"]
-
-    output["paragraphs"] = []
-    for para in soup.find_all("p"):
-        output["paragraphs"].append(para.get_text().strip())
-    if not output["paragraphs"]:
-        del output["paragraphs"]
-
-    output["images"] = []
-    for image in soup.find_all("img"):
-        if image.get("alt"):
-            output["images"].append(image.get("alt"))
-
-    if not output["images"]:
-        del output["images"]
-
-    # remove duplicates
-    for category in list(output.keys()):
-        if category == "title":
+        decompressed = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head, 512)
+    except zlib.error:
+        return False
+
+    return decompressed[257:262] == b"ustar"
+
+def find_processor(file_type=None, content_type=None, head=None):
+    """
+    picks the processor for a file, from its extension, its mime type and its first bytes.
+    returns None if nothing fits.
+    """
+
+    claimed = EXTENSION_MAP.get(file_type) or get_processor_for_mimetype(content_type)
+    if not head:
+        return claimed
+
+    sniffed = sniff_processor(head, claimed)
+    if sniffed:
+        # magic bytes don't lie, file extensions and servers do
+        return sniffed
+
+    return claimed
+
+@contextlib.contextmanager
+def open_stream(file_content, file_path=None):
+    """
+    gives processors a seekable stream over a file, whether they got its content or its path.
+    local files are memory mapped, so only the parts that are read get loaded
+    """
+
+    if not file_path:
+        yield io.BytesIO(file_content)
+        return
+
+    with open(file_path, "rb") as f:
+        try:
+            stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            yield f
+            return
+
+        with stream:
+            yield stream
+
+@contextlib.contextmanager
+def open_buffer(file_content, file_path=None):
+    """like open_stream, but gives something that can be sliced and searched like bytes"""
+
+    if not file_path:
+        yield file_content
+        return
+
+    with open(file_path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            yield b""
+            return
+
+        with buffer:
+            yield buffer
+
+def parse_page_ranges(pages, page_count):
+    """turns a page selection like "1-5,8,10-12" into a list of page numbers"""
+
+    selected = []
+    for part in str(pages).replace(" ", "").split(","):
+        if not part:
             continue
 
-        output[category] = utils.remove_duplicates(output[category])
-
-    # but not always...
-    if "headers" not in output.keys() and "paragraphs" not in output.keys():
-        # if nothing was found, first, fall back on common CSS classes
-        output["classes"] = {}
-        for class_name in (
-            "content",
-            "description",
-            "title",
-            "text",
-            "article",
-        ):
-            output["classes"][class_name] = []
-            for element in soup.find_all(
-                class_=re.compile(rf"\b{class_name}\b")
-            ):
-                if element.text != "":
-                    output["classes"][class_name].append(element.text)
-            # also get elements by id
-            for element in soup.find_all(id=re.compile(rf"\b{class_name}\b")):
-                if element.text != "":
-                    output["classes"][class_name].append(element.text)
-
-            if not output["classes"][class_name]:
-                # no data found for the class? just delete it from the response
-                del output["classes"][class_name]
-                continue
+        start, _, end = part.partition("-")
+        try:
+            start = int(start) if start else 1
+            end = (int(end) if end else page_count) if _ else start
+        except ValueError:
+            raise Exception(f"invalid page range: {part}")
 
-            # remove duplicates
-            output["classes"][class_name] = utils.remove_duplicates(
-                output["classes"][class_name]
-            )
+        selected.extend(range(max(start, 1), min(end, page_count) + 1))
 
-        if not output["classes"]:
-            # still nothing?
-            # then fall back on links if nothing could be extracted from the other html elements.
-            # this is a last resort because it tends to be a lot of data to process
+    return list(dict.fromkeys(selected))
 
-            del output["classes"]
+def format_page_ranges(page_numbers):
+    """the opposite of parse_page_ranges, so cursors stay short"""
 
-            output["urls"] = []
-            for a in soup.find_all("a", href=True):
-                output["urls"].append(a["href"])
+    ranges = []
+    for number in page_numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+
+    return ",".join(
+        str(start) if start == end else f"{start}-{end}"
+        for start, end in ranges
+    )
+
+# -------------------
+# --- PROCESSORS ---
+# -------------------
+@processor(
+    extensions=("htm", "html", "xhtml", "php", "asp"),
+    mimetypes=("text/html", "application/xhtml+xml"),
+    max_bytes=8 * MB,
+    cpu_heavy=True,
+    options=("charset",),
+)
+async def process_webpage(html, charset=None):
+    # scrapes a webpage in one pass, using the fastest html parser available.
+    # charset is the one the server sent, if it sent one
+    return await asyncio.to_thread(html_extract.extract, html, encoding=charset)
+
+# transcripts in these languages are preferred, otherwise the first one available is used
+YOUTUBE_LANGUAGES = ("en",)
+
+def get_youtube_transcript(video_id, languages=YOUTUBE_LANGUAGES):
+    """downloads the transcript of a youtube video. this blocks, so run it in a thread"""
+    import youtube_transcript_api
+
+    # get video transcript using a python module
+    ytt_api = youtube_transcript_api.YouTubeTranscriptApi()
 
-            # remove duplicate links
-            output["urls"] = utils.remove_duplicates(output["urls"])
+    try:
+        transcript_obj = ytt_api.fetch(video_id, languages=languages)
+    except:
+        # that likely means a transcript wasn't available in the preferred language.
+        # so fall back on the first one available:
+        transcript_obj_list = list(ytt_api.list(video_id))
+        transcript_obj = transcript_obj_list[0].fetch()
+
+    transcript = []
+    for snippet in transcript_obj:
+        transcript.append(snippet.text)
+    transcript_text = " ".join(transcript)
 
-            if not output["urls"]:
-                # alright, theres no saving this one. at least we have a title!
-                del output["urls"]
+    return {
+        "language": f"({transcript_obj.language_code}) {transcript_obj.language}",
+        "auto_generated": transcript_obj.is_generated,
+        "content": transcript_text,
+        "words": len(transcript_text.split(" ")),
+    }
 
-                output["message"] = (
-                    "nothing could be scraped from the page!"
-                )
+async def get_youtube_title(url):
+    """gets the title of a youtube video without downloading the whole watch page"""
 
-    return output
+    oembed_url = "https://www.youtube.com/oembed?format=json&url="+urllib.parse.quote(url, safe="")
+    try:
+        info = json.loads(await utils.http_request(oembed_url))
+    except Exception as e:
+        utils.console_log(f"couldn't get video title: {e}")
+        return None
+
+    return info.get("title")
 
 async def process_domains(domain, url, purpose, memory):
     if "youtube" in domain and "watch" in url or "youtu.be" in domain:
         # this is a youtube link. try and get the transcript!
-        import youtube_transcript_api
-
         err = None
 
-        # get video transcript using a python module
-        ytt_api = youtube_transcript_api.YouTubeTranscriptApi()
-
         parsed = urllib.parse.urlparse(url)
         # how to get the video id depends on if it's youtube or youtu.be
+        video_id = None
         if "youtube" in domain:
             query = urllib.parse.parse_qs(parsed.query)
             video_id = query.get("v", [None])[0]
-            if not video_id:
-                err = "No video id found in URL"
         elif domain == "youtu.be":
             video_id = parsed.path.lstrip("/")
 
-        try:
-            transcript_obj = ytt_api.fetch(video_id)
-        except:
-            # that likely means a transcript wasn't available in the preferred language.
-            # so fall back on the first one available:
-            try:
-                transcript_obj_list = list(ytt_api.list(video_id))
-                transcript_obj = transcript_obj_list[0].fetch()
-            except Exception as e:
-                err = f"couldn't find subtitles. tell the user the title of the video!"
+        async def get_transcript():
+            language = ",".join(YOUTUBE_LANGUAGES)
 
-        # get video title using beautifulsoup
-        from bs4 import BeautifulSoup
+            # summarizing a video and then saving it shouldn't download it twice
+            transcript = cache.get_transcript(video_id, language)
+            if transcript is None:
+                transcript = await asyncio.to_thread(get_youtube_transcript, video_id)
+                cache.store_transcript(video_id, language, transcript)
 
-        html = await utils.http_request(url)
-        soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
+            return transcript
 
-        title = soup.find("title").get_text().strip()
+        if not video_id:
+            err = "No video id found in URL"
+            title = await get_youtube_title(url)
+        else:
+            # get the title while the transcript downloads
+            transcript, title = await asyncio.gather(
+                get_transcript(), get_youtube_title(url), return_exceptions=True
+            )
+            if isinstance(transcript, BaseException):
+                err = f"couldn't find subtitles. tell the user the title of the video!"
 
         transcript_dict = {"type": "youtube", "title": title}
 
         if not err:
-            transcript = []
-            for snippet in transcript_obj:
-                transcript.append(snippet.text)
-            transcript_text = " ".join(transcript)
-
-            transcript_dict["transcript"] = {
-                "language": f"({transcript_obj.language_code}) {transcript_obj.language}",
-                "auto_generated": transcript_obj.is_generated,
-                "content": transcript_text,
-                "words": len(transcript_text.split(" ")),
-            }
+            transcript_dict["transcript"] = transcript
         else:
             transcript_dict["error"] = err
 
         return transcript_dict
 
-async def process_text(file_content):
-    return file_content.decode(errors="replace")
+@processor(
+    extensions=(
+        "asm",
+        "bas",
+        "bat",
+        "c",
+        "cc",
+        "cfg",
+        "cgi",
+        "clj",
+        "conf",
+        "cpp",
+        "css",
+        "dart",
+        "diff",
+        "elm",
+        "erl",
+        "ex",
+        "fs",
+        "go",
+        "hs",
+        "ini",
+        "java",
+        "jl",
+        "js",
+        "json",
+        "kt",
+        "lisp",
+        "log",
+        "lua",
+        "m",
+        "md",
+        "ml",
+        "pl",
+        "ps1",
+        "psm1",
+        "patch",
+        "py",
+        "r",
+        "rb",
+        "rs",
+        "s1",
+        "scala",
+        "scm",
+        "sh",
+        "sql",
+        "swift",
+        "ts",
+        "txt",
+        "toml",
+        "tsx",
+        "vim",
+        "zsh",
+    ),
+    mimetypes=("text/*", "application/json", "application/javascript"),
+    max_bytes=8 * MB,
+    takes_path=True,
+    options=("offset", "length", "lines", "line", "stop"),
+)
+async def process_text(file_content, file_path=None, offset=None, length=None, lines=None, line=None, stop=None):
+    # small files are returned as is. big ones are read a chunk at a time, straight from a
+    # memory map, so a huge log file never has to be loaded into memory.
+    # finding lines means going through the file, so that happens in a thread
+    return await asyncio.to_thread(read_text_chunk, file_content, file_path, offset, length, lines, line, stop)
+
+def read_text_chunk(file_content, file_path=None, offset=None, length=None, lines=None, line=None, stop=None):
+    length = int(length or TEXT_CHUNK_SIZE)
+
+    with open_buffer(file_content, file_path) as data:
+        size = len(data)
+        first_call = offset is None and lines is None
+
+        if first_call and size <= length:
+            return bytes(data[:]).decode(errors="replace")
+
+        if lines is not None:
+            first_line, _, last_line = str(lines).replace(" ", "").partition("-")
+            try:
+                line = max(int(first_line or 1), 1)
+                last_line = int(last_line) if last_line else None
+            except ValueError:
+                raise Exception(f"invalid line range: {lines}")
+
+            start = find_line_offset(data, line)
+            if last_line is not None:
+                stop = find_line_offset(data, last_line + 1)
+        else:
+            start = min(max(int(offset or 0), 0), size)
+            if offset is None:
+                line = 1
+
+        stop = size if stop is None else min(int(stop), size)
+        end = min(start + length, stop)
+        if end < stop:
+            # don't cut a line in half if we can help it
+            newline = data.rfind(b"\n", start, end)
+            if newline >= start:
+                end = newline + 1
+
+        chunk = bytes(data[start:end])
+
+        output = {
+            "content": chunk.decode(errors="replace"),
+            "offset": start,
+            "length": end - start,
+            "file_size": size,
+        }
+
+        if line is not None:
+            output["first_line"] = line
+
+        if first_call:
+            output["estimated_lines"] = estimate_line_count(data)
+
+        if end < stop:
+            cursor = {"offset": end, "length": length}
+            if stop < size:
+                cursor["stop"] = stop
+            if line is not None:
+                cursor["line"] = line + chunk.count(b"\n")
+            output["next_cursor"] = utils.encode_cursor(cursor)
+
+    return output
+
+TEXT_CHUNK_SIZE = 128 * 1024
+# newlines are counted in blocks this big
+TEXT_SCAN_SIZE = 1 * MB
+
+def find_line_offset(data, line):
+    """returns the byte offset where a line (starting at 1) begins"""
+
+    if line <= 1:
+        return 0
+
+    # count whole blocks first, bytes.count is a lot faster than searching line by line
+    newlines_needed = line - 1
+    position = 0
+    while position < len(data):
+        block = data[position:position + TEXT_SCAN_SIZE]
+        newlines = block.count(b"\n")
+        if newlines < newlines_needed:
+            newlines_needed -= newlines
+            position += len(block)
+            continue
+
+        index = -1
+        for _ in range(newlines_needed):
+            index = block.find(b"\n", index + 1)
+        return position + index + 1
+
+    # past the end of the file
+    return len(data)
+
+def estimate_line_count(data):
+    """counts the lines in a file, or estimates it from the start for big files"""
+
+    sample = data[:TEXT_SCAN_SIZE]
+    newlines = sample.count(b"\n")
+
+    if len(data) <= TEXT_SCAN_SIZE:
+        return newlines + (1 if sample and not sample.endswith(b"\n") else 0)
+
+    return int(newlines / len(sample) * len(data))
+
+@processor(
+    extensions=(
+        "jpg",
+        "jpeg",
+        "png",
+        "gif",
+        "bmp",
+        "svg",
+        "tiff",
+        "webp",
+        "ico",
+        "raw",
+        "heic",
+        "avif",
+        "eps",
+        "ai",
+    ),
+    mimetypes=("image/*",),
+    magic=(
+        (0, b"\xff\xd8\xff"),
+        (0, b"\x89PNG\r\n\x1a\n"),
+        (0, b"GIF87a"),
+        (0, b"GIF89a"),
+        (8, b"WEBP"),
+        (0, b"II*\x00"),
+        (0, b"MM\x00*"),
+    ),
+    max_bytes=32 * MB,
+    cpu_heavy=True,
+    takes_path=True,
+    options=("thumbnail_size", "checksum"),
+)
+async def process_image(file_content, file_path=None, thumbnail_size=None, checksum=None):
+    # returns what the image is, not the image itself. a (small) thumbnail only when asked for
+    from PIL import Image, ExifTags, UnidentifiedImageError
+
+    # not memory mapped, pillow likes to seek past the end of small files while identifying them
+    with (open(file_path, "rb") if file_path else io.BytesIO(file_content)) as stream:
+        try:
+            # only reads the header, the pixels are decoded when they're needed
+            img = Image.open(stream)
+        except UnidentifiedImageError:
+            stream.seek(0)
+            source = stream.read(IMAGE_MAX_SVG_SOURCE)
+            if b"<svg" in source:
+                # svg is just xml, so the source says more than anything else would
+                return {"format": "SVG", "source": source.decode(errors="replace")}
+            return {"error": "this image format can't be read. you have to use another tool to process this."}
+
+        with img:
+            output = {
+                "format": img.format,
+                "width": img.width,
+                "height": img.height,
+                "mode": img.mode,
+            }
+
+            frames = getattr(img, "n_frames", 1)
+            if frames > 1:
+                output["frames"] = frames
+
+            exif = {}
+            for tag, value in img.getexif().items():
+                if isinstance(value, bytes):
+                    # binary blobs like maker notes are useless here
+                    continue
+                exif[ExifTags.TAGS.get(tag, str(tag))] = str(value)[:IMAGE_MAX_EXIF_VALUE]
+            if exif:
+                output["exif"] = exif
+
+            if thumbnail_size:
+                output["thumbnail"] = make_thumbnail(img, int(thumbnail_size), checksum)
+
+    return output
+
+IMAGE_MAX_SVG_SOURCE = 16 * 1024
+IMAGE_MAX_EXIF_VALUE = 256
+# thumbnails get re-encoded with lower quality (and then smaller) until they fit
+IMAGE_THUMBNAIL_MAX_BYTES = 256 * 1024
 
-async def process_image(file_content):
+def make_thumbnail(img, thumbnail_size, checksum=None):
     import base64
+    from PIL import Image
+
+    data = cache.get_thumbnail(checksum, thumbnail_size) if checksum else None
+
+    if data is None:
+        # jpegs can be decoded at a fraction of their size, which is a lot faster
+        img.draft("RGB", (thumbnail_size, thumbnail_size))
+
+        thumbnail = img.convert("RGB")
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+
+        quality = 85
+        while True:
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format="JPEG", quality=quality, optimize=True)
+            data = buffer.getvalue()
+
+            if len(data) <= IMAGE_THUMBNAIL_MAX_BYTES or max(thumbnail.size) <= 64:
+                break
+
+            # too big, try again a bit worse
+            if quality > 40:
+                quality -= 15
+            else:
+                thumbnail.thumbnail((int(thumbnail.width * 0.75), int(thumbnail.height * 0.75)))
+
+        if checksum:
+            cache.store_thumbnail(checksum, thumbnail_size, data)
 
-    return base64.b64encode(file_content).decode("utf-8")
+    with Image.open(io.BytesIO(data)) as thumbnail:
+        width, height = thumbnail.size
 
+    return {
+        "format": "JPEG",
+        "width": width,
+        "height": height,
+        "size": len(data),
+        "base64": base64.b64encode(data).decode("utf-8"),
+    }
+
+@processor(
+    extensions=("xml",),
+    mimetypes=("application/xml", "text/xml"),
+    max_bytes=8 * MB,
+    cpu_heavy=True,
+)
 async def process_xml(file_content):
     import xmltodict
 
     return xmltodict.parse(file_content.decode(errors="replace"))
 
+@processor(
+    extensions=("yaml", "yml"),
+    mimetypes=("application/yaml", "application/x-yaml", "text/yaml"),
+    max_bytes=8 * MB,
+    cpu_heavy=True,
+)
 async def process_yaml(file_content):
     import yaml
     import json
@@ -191,6 +636,12 @@ async def process_yaml(file_content):
     except yaml.YAMLError as e:
         return f"YAML Error: {e}"
 
+@processor(
+    extensions=("csv",),
+    mimetypes=("text/csv",),
+    max_bytes=8 * MB,
+    cpu_heavy=True,
+)
 async def process_csv(file_content):
     from io import StringIO
     import csv
@@ -201,91 +652,493 @@ async def process_csv(file_content):
 
     return output
 
-async def process_pdf(file_content):
-    from io import BytesIO
+# how many pages to return at once, unless asked otherwise
+PDF_MAX_PAGES = 20
+PDF_MAX_OUTLINE_ENTRIES = 200
+
+@processor(
+    extensions=("pdf",),
+    mimetypes=("application/pdf",),
+    magic=((0, b"%PDF-"),),
+    # the cross-reference table is at the end, so a pdf that's cut off can't be read at all.
+    # it's written to disk instead of being kept in memory, so size isn't an issue
+    max_bytes=None,
+    spool=True,
+    cpu_heavy=True,
+    takes_path=True,
+    options=("pages", "max_pages", "checksum"),
+)
+async def process_pdf(file_content, file_path=None, pages=None, max_pages=None, checksum=None):
+    # only the requested pages get parsed, the rest can be fetched using the cursor
     import pypdf
 
-    pdfreader = pypdf.PdfReader(BytesIO(file_content))
-    pages_text = []
-    for page in pdfreader.pages:
-        text = page.extract_text()
-        if text:
-            pages_text.append(text)
+    max_pages = max_pages or PDF_MAX_PAGES
 
-    return pages_text
+    with open_stream(file_content, file_path) as stream:
+        pdfreader = pypdf.PdfReader(stream)
+        page_count = len(pdfreader.pages)
 
-async def process_audio(file_content):
-    from io import BytesIO
-    import tinytag
+        output = {"page_count": page_count}
+
+        if not pages:
+            # first call for this document. the metadata and outline are cheap to get,
+            # and they help with deciding which pages to read next
+            pages = f"1-{page_count}"
+            output["metadata"] = {
+                key.lstrip("/").lower(): str(value)
+                for key, value in (pdfreader.metadata or {}).items()
+            }
+            try:
+                output["outline"] = get_pdf_outline(pdfreader, pdfreader.outline)
+            except Exception:
+                # broken outlines are common, and not worth failing over
+                pass
 
-    tagreader = tinytag.TinyTag.get(file_obj=BytesIO(file_content))
-    return tagreader.as_dict()
+        requested = parse_page_ranges(pages, page_count)
+        batch, remaining = requested[:max_pages], requested[max_pages:]
 
-async def process_video(file_content):
-    import moviepy
+        output["pages"] = []
+        for page_number in batch:
+            # the text of every page is cached, so paging through a document never re-parses a page
+            cache_key = f"process_pdf:page:{page_number}"
+            text = cache.get_processed(checksum, cache_key) if checksum else None
+            if text is None:
+                text = pdfreader.pages[page_number - 1].extract_text() or ""
+                if checksum:
+                    cache.store_processed(checksum, cache_key, text)
+
+            output["pages"].append({"page": page_number, "text": text})
+
+    if remaining:
+        output["next_cursor"] = utils.encode_cursor({"pages": format_page_ranges(remaining)})
+        output["remaining_pages"] = len(remaining)
+
+    return output
+
+def get_pdf_outline(pdfreader, outline, level=0, entries=None):
+    if entries is None:
+        entries = []
+
+    for item in outline:
+        if len(entries) >= PDF_MAX_OUTLINE_ENTRIES:
+            break
+
+        if isinstance(item, list):
+            # nested sections
+            get_pdf_outline(pdfreader, item, level + 1, entries)
+            continue
+
+        page_number = pdfreader.get_destination_page_number(item)
+        entries.append({
+            "title": item.title,
+            "page": page_number + 1 if page_number is not None else None,
+            "level": level,
+        })
+
+    return entries
+
+# media files are probed where they are, reading only the container headers and tags.
+# for urls only the start and the end of the file get downloaded, into a sparse file
+# of the original size, so that the tags, the duration and the index are all where
+# the probe expects them
+@processor(
+    extensions=("mp3", "m4a", "ogg", "flac", "wma", "aiff", "wav", "aac"),
+    mimetypes=("audio/*",),
+    magic=(
+        (0, b"ID3"),
+        (0, b"fLaC"),
+        (0, b"OggS"),
+        (8, b"WAVE"),
+        (8, b"AIFF"),
+        (4, b"ftypM4A"),
+    ),
+    max_bytes=1 * MB,
+    spool=True,
+    tail_bytes=128 * 1024,
+    takes_path=True,
+)
+async def process_audio(file_content, file_path=None):
+    import tinytag
+
+    if file_path:
+        tagreader = await asyncio.to_thread(tinytag.TinyTag.get, file_path)
+    else:
+        tagreader = tinytag.TinyTag.get(file_obj=io.BytesIO(file_content))
+
+    tags = tagreader.as_dict()
+    # might be a temporary file, and the result already says where it came from
+    tags.pop("filename", None)
+    return tags
+
+VIDEO_FTYP_BRANDS = (
+    b"isom", b"iso2", b"iso4", b"iso5", b"iso6",
+    b"mp41", b"mp42", b"avc1", b"dash", b"mmp4", b"msnv",
+    b"M4V ", b"M4VH", b"M4VP", b"qt  ", b"f4v ",
+    b"3gp4", b"3gp5", b"3gp6", b"3g2a",
+)
+
+@processor(
+    extensions=("mp4", "mkv", "mov", "avi", "wmv", "mpeg", "mpg", "m4v", "webm"),
+    mimetypes=("video/*",),
+    magic=(
+        # mp4 and friends all start with ftyp, followed by a brand that says what's inside.
+        # heic and avif images use the same container, so only video brands count
+        *((4, b"ftyp"+brand) for brand in VIDEO_FTYP_BRANDS),
+        (0, b"\x1a\x45\xdf\xa3"),
+        (8, b"AVI "),
+    ),
+    max_bytes=4 * MB,
+    spool=True,
+    # mp4 files often keep their index at the end
+    tail_bytes=8 * MB,
+    takes_path=True,
+)
+async def process_video(file_content, file_path=None):
     import tempfile
 
-    # moviepy is stubborn and absolutely insists on a file name, not a file object
-    # so let's write it to a file i guess...
-    tmp_path = ""
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(file_content)
-        tmp_path = tmp.name
+    # ffmpeg needs a file name. that's only a problem if we got the content itself
+    tmp_path = None
+    if not file_path:
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(file_content)
+            tmp_path = file_path = tmp.name
 
-    clip = None
     try:
-        clip = moviepy.VideoFileClip(tmp_path)
-
-        output = {
-            "duration": clip.duration,
-            "fps": clip.fps,
-            "width": clip.w,
-            "height": clip.h,
-            "has_audio": clip.audio is not None,
-            "audio_channels": clip.audio.nchannels if clip.audio else None,
-            "audio_fps": clip.audio.fps if clip.audio else None,
-            "misc": getattr(clip.reader, "infos", None),
-        }
+        infos = await asyncio.to_thread(probe_media, file_path)
     finally:
-        if clip:
-            clip.close()
-        os.remove(tmp_path)
+        if tmp_path:
+            os.remove(tmp_path)
+
+    width, height = infos.get("video_size") or (None, None)
+    has_audio = bool(infos.get("audio_found"))
+
+    return {
+        "duration": infos.get("duration"),
+        "fps": infos.get("video_fps"),
+        "width": width,
+        "height": height,
+        "has_audio": has_audio,
+        "audio_channels": infos.get("audio_channels") if has_audio else None,
+        "audio_fps": infos.get("audio_fps") if has_audio else None,
+        "misc": infos,
+    }
+
+def probe_media(file_path):
+    """
+    reads the stream information of a media file with the ffmpeg binary that comes with imageio-ffmpeg.
+    ffmpeg only reads the container headers for this, nothing gets decoded
+    """
+    import re
+    import subprocess
+    import imageio_ffmpeg
+    from moviepy.video.io.ffmpeg_reader import FFmpegInfosParser
+
+    proc = subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-i", file_path],
+        capture_output=True,
+        stdin=subprocess.DEVNULL,
+        timeout=30,
+    )
+    # without an output file ffmpeg exits with an error, but it prints what it found first
+    ffmpeg_output = proc.stderr.decode(errors="replace")
+
+    try:
+        infos = FFmpegInfosParser(ffmpeg_output, file_path).parse()
+    except Exception:
+        raise Exception(f"couldn't read media file: {ffmpeg_output.strip().splitlines()[-1:]}")
+
+    # moviepy doesn't parse the channel layout, e.g. "Audio: aac (LC), 44100 Hz, stereo, fltp"
+    match = re.search(r"Audio: .*?, \d+ Hz, ([^,]+)", ffmpeg_output)
+    if match:
+        layout = match.group(1).strip()
+        channels = re.match(r"(\d+) channels", layout)
+        if layout == "mono":
+            infos["audio_channels"] = 1
+        elif layout == "stereo":
+            infos["audio_channels"] = 2
+        elif channels:
+            infos["audio_channels"] = int(channels.group(1))
+        elif re.match(r"\d+\.\d+", layout):
+            # surround layouts like 5.1 or 7.1
+            infos["audio_channels"] = sum(int(n) for n in re.match(r"(\d+)\.(\d+)", layout).groups())
+        else:
+            infos["audio_channels"] = layout
+
+    return infos
+
+# archives are listed from their headers only, a page of entries at a time.
+# nothing gets extracted and local archives are memory mapped, so listing a huge
+# backup doesn't load it into memory
+ARCHIVE_MAX_ENTRIES = 500
+
+def format_timestamp(timestamp):
+    try:
+        return datetime.datetime.fromtimestamp(timestamp).isoformat()
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+def format_date_time(date_time):
+    # many archivers write a zero date (1980-00-00) for entries without one
+    try:
+        return datetime.datetime(*date_time).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+def list_archive_entries(entries, entry_offset=0, total_entries=None):
+    """
+    takes a page of entries from an iterator of entry dicts and builds the result.
+    total_entries is None if the archive format doesn't know it up front.
+    """
+
+    output = {"entries": []}
+
+    page_end = entry_offset + ARCHIVE_MAX_ENTRIES
+    more = False
+    for i, entry in enumerate(entries):
+        if i < entry_offset:
+            continue
+        if i >= page_end:
+            more = True
+            break
+
+        if entry.get("compressed_size") is not None and entry["size"]:
+            entry["ratio"] = round(entry["compressed_size"] / entry["size"], 3)
+        output["entries"].append(entry)
+
+    if total_entries is not None:
+        output["total_entries"] = total_entries
+
+    if more:
+        output["next_cursor"] = utils.encode_cursor({"entry_offset": page_end})
 
     return output
 
-async def process_zip(file_content):
-    from io import BytesIO
+@processor(
+    extensions=("zip",),
+    mimetypes=("application/zip",),
+    magic=((0, b"PK\x03\x04"), (0, b"PK\x05\x06")),
+    # everything needed for a listing is in the central directory at the end
+    max_bytes=64 * 1024,
+    spool=True,
+    tail_bytes=32 * MB,
+    cpu_heavy=True,
+    takes_path=True,
+    options=("entry_offset", "checksum"),
+)
+async def process_zip(file_content, file_path=None, entry_offset=0, checksum=None):
     import zipfile
 
-    zip = zipfile.ZipFile(BytesIO(file_content))
-    return zip.namelist()
+    # the central directory of a big zip takes a while to parse, so the whole listing is
+    # cached, and every page after the first is just a slice of it
+    cache_key = "process_zip:entries"
+    entries = cache.get_processed(checksum, cache_key) if checksum else None
+
+    if entries is None:
+        with open_stream(file_content, file_path) as stream:
+            # only reads the central directory
+            infolist = zipfile.ZipFile(stream).infolist()
+
+        entries = [
+            {
+                "name": info.filename,
+                "is_dir": info.is_dir(),
+                "size": info.file_size,
+                "compressed_size": info.compress_size,
+                "modified": format_date_time(info.date_time),
+            }
+            for info in infolist
+        ]
+        if checksum:
+            cache.store_processed(checksum, cache_key, entries)
 
-async def process_rar(file_content):
-    from io import BytesIO
+    output = list_archive_entries(iter(entries), entry_offset, len(entries))
+    output["total_size"] = sum(entry["size"] for entry in entries)
+
+    return output
+
+@processor(
+    extensions=("rar",),
+    mimetypes=("application/vnd.rar", "application/x-rar-compressed"),
+    magic=((0, b"Rar!\x1a\x07"),),
+    max_bytes=64 * MB,
+    spool=True,
+    takes_path=True,
+    options=("entry_offset",),
+)
+async def process_rar(file_content, file_path=None, entry_offset=0):
     import rarfile
 
-    rar = rarfile.RarFile(BytesIO(file_content))
-    output = []
-    for f in rar.infolist():
-        output.append(f.filename)
+    with open_stream(file_content, file_path) as stream:
+        # rar keeps a header in front of every file, these are read while skipping the data
+        infolist = await asyncio.to_thread(lambda: rarfile.RarFile(stream).infolist())
+
+    def entries():
+        for info in infolist:
+            modified = info.mtime.isoformat() if info.mtime else format_date_time(info.date_time)
+            yield {
+                "name": info.filename,
+                "is_dir": info.is_dir(),
+                "size": info.file_size,
+                "compressed_size": info.compress_size,
+                "modified": modified,
+            }
+
+    output = list_archive_entries(entries(), entry_offset, len(infolist))
+    output["total_size"] = sum(info.file_size for info in infolist)
 
     return output
 
-async def process_tar(file_content):
-    from io import BytesIO
+@processor(
+    extensions=("gz",),
+    mimetypes=("application/gzip", "application/x-gzip"),
+    magic=((0, b"\x1f\x8b"),),
+    max_bytes=8 * MB,
+    cpu_heavy=True,
+)
+async def process_gzip(file_content):
+    # a plain gzipped file, not a tar archive
+    import zlib
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(file_content, 8 * MB)
+    except zlib.error as e:
+        return f"couldn't decompress file: {e}"
+
+    output = {
+        "decompressed_size": len(data),
+        "truncated": bool(decompressor.unconsumed_tail) or not decompressor.eof,
+    }
+
+    if b"\0" in data[:SNIFF_SIZE]:
+        output["content"] = "compressed binary data. use another tool to process this."
+    else:
+        output["content"] = data.decode(errors="replace")
+
+    return output
+
+@processor(
+    extensions=("tar", "tgz"),
+    mimetypes=("application/x-tar",),
+    magic=((257, b"ustar"),),
+    max_bytes=64 * MB,
+    spool=True,
+    cpu_heavy=True,
+    takes_path=True,
+    options=("entry_offset",),
+)
+async def process_tar(file_content, file_path=None, entry_offset=0):
     import tarfile
 
-    tar = tarfile.open(fileobj=BytesIO(file_content))
+    output = {}
 
-    output = []
-    for f in tar.getmembers():
-        output.append(f.name)
+    with open_stream(file_content, file_path) as stream:
+        tar = tarfile.open(fileobj=stream, mode="r:*")
+
+        def entries():
+            # tar has no index, so walk the headers one by one.
+            # the data in between is skipped over (or decompressed and thrown away)
+            try:
+                while True:
+                    member = tar.next()
+                    if member is None:
+                        output["complete"] = True
+                        return
+                    # tarfile remembers every member it has seen, we don't need that
+                    tar.members.clear()
+
+                    yield {
+                        "name": member.name,
+                        "is_dir": member.isdir(),
+                        "size": member.size,
+                        "modified": format_timestamp(member.mtime),
+                    }
+            except (tarfile.ReadError, EOFError) as e:
+                # this happens when only the start of the archive was downloaded
+                output["error"] = f"archive ends early: {e}"
+
+        output.update(list_archive_entries(entries(), entry_offset))
+
+    if output.pop("complete", False):
+        # we only know how many entries there are once we've seen all of them
+        output["total_entries"] = entry_offset + len(output["entries"])
 
     return output
 
+@processor(
+    extensions=(
+        "bin",
+        "exe",
+        "dll",
+        "elf",
+        "msi",
+        "com",
+        "cmd",
+        "msp",
+        "so",
+        "a",
+        "la",
+        "dmg",
+        "app",
+        "appimage",
+        "flatpak",
+        "x64",
+        "x86",
+        "arm",
+        "jar",
+        "apk",
+        "deb",
+        "rpm",
+    ),
+    mimetypes=(
+        "application/octet-stream",
+        "application/x-msdownload",
+        "application/x-executable",
+    ),
+    magic=((0, b"\x7fELF"), (0, b"MZ")),
+    max_bytes=0,
+)
 async def process_exe(file_content):
     return "user submitted an executable file. use a tool call that searches the web to fetch further information."
 
+async def fetch_tail(url, fetched, processor):
+    """
+    if a spooled file got cut off and its processor needs the end of it too,
+    fetches the end and writes it where it belongs, leaving a hole in between
+    """
+
+    if (
+        not processor or
+        not fetched["truncated"] or
+        "spool_path" not in fetched or
+        not PROCESSORS[processor]["tail_bytes"] or
+        not fetched["content_length"]
+    ):
+        return
+
+    tail_size = min(PROCESSORS[processor]["tail_bytes"], fetched["content_length"] - fetched["size"])
+    if tail_size <= 0:
+        return
+
+    utils.console_log(f"fetching the last {utils.sizeof_format(tail_size)}..")
+    tail = await utils.http_fetch_range(url, -tail_size)
+    if not tail:
+        return
+
+    def write_tail():
+        with open(fetched["spool_path"], "r+b") as f:
+            f.seek(fetched["content_length"] - len(tail))
+            f.write(tail)
+
+    await asyncio.to_thread(write_tail)
+
+    # the checksum computed while streaming only covers the start. add the end to it,
+    # instead of hashing the whole file afterwards, most of which is a hole full of zeros
+    tail_hash = hashlib.sha256(f"{fetched['checksum']}:{fetched['content_length']}:".encode())
+    tail_hash.update(tail)
+    fetched["checksum"] = tail_hash.hexdigest()
+    fetched["size"] += len(tail)
+
 # ---------------------
 # --- MAIN FUNCTION ---
 # ---------------------
@@ -294,11 +1147,26 @@ async def read_file_or_url(
     purpose: str,
     memory: str,
     multi: bool = False,
+    pages: str = None,
+    max_pages: int = None,
+    thumbnail_size: int = None,
+    offset: int = None,
+    length: int = None,
+    lines: str = None,
+    cursor: str = None,
+    rank: bool = False,
 ):
     """
     processes any file or url user may have provided.
     use the "purpose" argument to describe the purpose of this request.
     use the "memory" argument for details that must be remembered by the LLM after parsing all the data, such as details about the user.
+    set "rank" to true to only get the passages most relevant to the purpose, instead of everything. useful for long pages and documents.
+
+    for documents such as PDFs, use "pages" to pick which pages to read (for example "1-5,9") and "max_pages" to limit how many are returned at once.
+    the first read of a document also returns its outline, so you can pick the pages you need.
+    big text files are returned a chunk at a time. use "offset" and "length" (in bytes) or "lines" (for example "100-200") to pick which part to read.
+    images return their dimensions, format and EXIF data. set "thumbnail_size" (max width/height in pixels) to also get a small JPEG thumbnail as base64.
+    if a result contains a "next_cursor", pass it as the "cursor" argument (with the same path) to get the next part.
 
     will process:
     - websites
@@ -324,7 +1192,63 @@ async def read_file_or_url(
 
     utils.console_log(f"processing path: {path}")
 
+    # options for the processors. a cursor continues where an earlier call left off
+    options = {
+        "pages": pages,
+        "max_pages": max_pages,
+        "thumbnail_size": thumbnail_size,
+        "offset": offset,
+        "length": length,
+        "lines": lines,
+    }
+    if cursor:
+        # the cursor says exactly where to continue, a line range sent along with it would start over
+        options["lines"] = None
+        options.update(utils.decode_cursor(cursor))
+
+    # if the same thing is already being read (parallel tool calls, or a search result
+    # that's also being read directly), wait for that instead of fetching it again
+    if urllib.parse.urlparse(path).scheme != "":
+        key = cache.normalize_url(path)
+    else:
+        key = os.path.realpath(os.path.expanduser(path))
+    key = ("read", key, json.dumps(options, sort_keys=True))
+
+    result, complete = await utils.single_flight(
+        key, lambda: _read_path(path, purpose, memory, options)
+    )
+
+    # the result is shared with everyone else who asked for it
+    result = dict(result)
+
+    if rank and result.get("data") and result.get("status") != "error":
+        result["data"] = await workers.run(ranking.rank, result["data"], purpose)
+
+    if complete:
+        return result
+
+    if not multi:
+        result["ai_instructions"] = {
+            "important_details": memory,
+            "purpose_of_request": purpose,
+        }
+        utils.console_log("done processing")
+        return utils.result(result)
+    else:
+        return result
+
+async def _read_path(path, purpose, memory, options):
+    """
+    does the actual work for read_file_or_url.
+    returns the result and whether it's complete, meaning it should be returned as-is
+    """
+
     output = {}
+    processor = None
+    fetched = None
+    file_path = None
+    checksum = None
+    charset = None
 
     # check if path is file or url
     url_parser = urllib.parse.urlparse(path)
@@ -339,12 +1263,49 @@ async def read_file_or_url(
         # first, process any special domains, such as youtube
         output = await process_domains(domain, path, purpose, memory)
         if output:
-            return utils.result(output)
+            return utils.result(output), True
 
         # then if that didn't do anything, switch to Processing based on file type
-
-        # get the content of whatever file is at the url
-        file_content = await utils.http_request(path)
+        def choose_budget(content_type, content_length, head):
+            # now that we know what the server says it is and what it looks like, pick a processor
+            nonlocal processor
+            processor = find_processor(file_type, content_type, head)
+            if not processor:
+                # we'll assume it's a website, like we always have
+                processor_info = PROCESSORS[process_webpage] if not file_type else {"max_bytes": 0, "spool": False}
+            else:
+                processor_info = PROCESSORS[processor]
+            return (processor_info["max_bytes"], processor_info["spool"])
+
+        cached = cache.get_response(path)
+        if cached and cache.is_fresh(cached):
+            utils.console_log("using cached response")
+            fetched = None
+        else:
+            # stream the content of whatever file is at the url, but only as much as we need.
+            # if we have an older copy, the server can tell us to just use that one
+            fetched = await utils.http_fetch(
+                path, choose_budget, headers=cache.conditional_headers(cached)
+            )
+            if fetched.get("not_modified"):
+                utils.console_log("cached response is still valid")
+                cache.refresh_response(path, cached, fetched)
+                fetched = None
+            else:
+                cache.store_response(path, fetched)
+                await fetch_tail(path, fetched, processor)
+
+        if fetched:
+            file_content = fetched.get("content")
+            checksum = fetched["checksum"]
+            charset = fetched.get("charset")
+        else:
+            file_content = cached["content"]
+            checksum = cached.get("checksum")
+            charset = cached.get("charset")
+            choose_budget(cached["content_type"], cached["content_length"], file_content[:SNIFF_SIZE])
+            if not file_type and processor:
+                file_type = "website" if processor == process_webpage else cached["content_type"]
     else:
         # not a url
         path = os.path.expanduser(path)
@@ -355,218 +1316,214 @@ async def read_file_or_url(
 
                 file_name, file_type = os.path.splitext(os.path.basename(path))
                 file_type = file_type.lstrip('.')
+                # only hashed if it changed since last time, but that can still take a while for big files
+                checksum = await asyncio.to_thread(cache.get_file_checksum, path)
                 with open(path, 'rb') as f:
-                    file_content = f.read()
+                    head = f.read(SNIFF_SIZE)
+                    processor = find_processor(file_type, head=head)
+
+                    if processor and PROCESSORS[processor]["takes_path"]:
+                        # it'll open the file itself, and only read what it needs
+                        file_content = None
+                        file_path = path
+                    else:
+                        file_content = head + f.read()
             elif os.path.isdir(path):
-                return utils.list_dir(path)
+                return utils.list_dir(path), True
         else:
             # file not found!
-            return utils.result(None, "no such file or directory")
-
-    import hashlib
-
-    filetype_map = {
-        ("htm", "html", "xhtml", "php", "asp"): process_webpage,
-        (
-            "asm",
-            "bas",
-            "bat",
-            "c",
-            "cc",
-            "cfg",
-            "cgi",
-            "clj",
-            "conf",
-            "cpp",
-            "css",
-            "dart",
-            "diff",
-            "elm",
-            "erl",
-            "ex",
-            "fs",
-            "go",
-            "hs",
-            "ini",
-            "java",
-            "jl",
-            "js",
-            "json",
-            "kt",
-            "lisp",
-            "log",
-            "lua",
-            "m",
-            "md",
-            "ml",
-            "php",
-            "pl",
-            "ps1",
-            "psm1",
-            "patch",
-            "py",
-            "r",
-            "rb",
-            "rs",
-            "s1",
-            "scala",
-            "scm",
-            "sh",
-            "sql",
-            "swift",
-            "ts",
-            "txt",
-            "toml",
-            "tsx",
-            "vim",
-            "zsh",
-        ): process_text,
-        (
-            "jpg",
-            "jpeg",
-            "png",
-            "gif",
-            "bmp",
-            "svg",
-            "tiff",
-            "webp",
-            "ico",
-            "raw",
-            "heic",
-            "eps",
-            "ai",
-        ): process_image,
-        ("mp3", "m4a", "ogg", "flac", "wma", "aiff", "wav", "aac"): process_audio,
-        (
-            "mp4",
-            "mkv",
-            "mov",
-            "avi",
-            "wmv",
-            "mpeg",
-            "mpg",
-            "m4v",
-        ): process_video,
-        ("tar", "gz", "tgz"): process_tar,
-        (
-            "bin",
-            "exe",
-            "dll",
-            "elf",
-            "msi",
-            "com",
-            "cmd",
-            "msp",
-            "so",
-            "a",
-            "la",
-            "bin",
-            "dmg",
-            "app",
-            "appimage",
-            "flatpak",
-            "x64",
-            "x86",
-            "arm",
-            "jar",
-            "apk",
-            "deb",
-            "rpm",
-        ): process_exe,
-        ("zip",): process_zip,
-        ("rar",): process_rar,
-        ("xml",): process_xml,
-        ("yaml",): process_yaml,
-        ("csv",): process_csv,
-        ("pdf",): process_pdf,
-    }
-
-    processor = None
-    for exts, fetched_processor in filetype_map.items():
-        if file_type in exts:
-            processor = fetched_processor
-            break
+            return utils.result(None, "no such file or directory"), True
 
-    if processor:
-        utils.console_log("processing using "+processor.__name__)
-        output = await processor(file_content)
-    elif not file_type:
-        # for now, we assume it's a website.
-        # TODO: add mime type checking
-        utils.console_log("processing using process_webpage")
-        output = await process_webpage(file_content)
-
-        file_type = "website"
-    else:
-        # some unknown file format
-        # add MIME type-based Processing later
-        utils.console_log("could not find valid processor!")
+    try:
+        if fetched and "spool_path" in fetched:
+            file_path = fetched["spool_path"]
+
+        if fetched:
+            # what was actually downloaded. a spooled file that got cut off is as big
+            # as the original, but mostly empty. the checksum was made while fetching
+            size = fetched["size"]
+        elif file_path:
+            size = os.path.getsize(file_path)
+            if not checksum:
+                # hash it from disk instead of loading all of it
+                checksum = await asyncio.to_thread(utils.hash_file, file_path)
+        else:
+            size = len(file_content)
+            if not checksum:
+                checksum = hashlib.sha256(file_content).hexdigest()
+
+        if processor:
+            processor_info = PROCESSORS[processor]
+            kwargs = {
+                name: options[name]
+                for name in processor_info["options"]
+                if options.get(name) is not None
+            }
+            if "checksum" in processor_info["options"]:
+                kwargs["checksum"] = checksum
+            if "charset" in processor_info["options"] and charset:
+                kwargs["charset"] = charset
+            if file_path:
+                kwargs["file_path"] = file_path
+
+            # if we've already processed these exact bytes the same way before, don't do it again
+            cache_key = processor.__name__
+            processor_options = {k: v for k, v in kwargs.items() if k not in ("file_path", "checksum")}
+            if processor_options:
+                cache_key += ":"+json.dumps(processor_options, sort_keys=True)
+
+            output = cache.get_processed(checksum, cache_key)
+            if output is not None:
+                utils.console_log("using cached output of "+processor.__name__)
+            else:
+                utils.console_log("processing using "+processor.__name__)
+                if processor_info["cpu_heavy"]:
+                    # keep the event loop free for other requests
+                    output = await workers.run(processor, file_content, **kwargs)
+                else:
+                    output = await processor(file_content, **kwargs)
+                cache.store_processed(checksum, cache_key, output)
+
+            if not file_type and fetched:
+                file_type = "website" if processor == process_webpage else fetched["content_type"]
+        elif not file_type:
+            # for now, we assume it's a website.
+            utils.console_log("processing using process_webpage")
+            output = await workers.run(process_webpage, file_content, charset=charset)
+
+            file_type = "website"
+        else:
+            # some unknown file format
+            utils.console_log("could not find valid processor!")
 
-        output = (
-            "unsupported file format! you have to use another tool to process this."
-        )
+            output = (
+                "unsupported file format! you have to use another tool to process this."
+            )
+    finally:
+        if fetched and "spool_path" in fetched:
+            os.remove(fetched["spool_path"])
 
     result = {
         "path": path,
         "filename": file_name,
         "type": file_type,
-        "size": len(file_content),
-        "checksum": hashlib.sha256(file_content).hexdigest(),
+        "size": size,
+        "checksum": checksum,
         "data": output,
     }
 
-    if not multi:
-        result["ai_instructions"] = {
-            "important_details": memory,
-            "purpose_of_request": purpose,
-        }
-        utils.console_log("done processing")
-        return utils.result(result)
-    else:
-        return result
+    if fetched and fetched["truncated"]:
+        # let the LLM know it's only seeing the start of the file
+        result["truncated"] = True
+        result["content_length"] = fetched["content_length"]
+
+    return result, False
+
+# how many paths read_multiple_files_or_urls works on at once, in total and per website
+READ_MAX_CONCURRENCY = 8
+READ_MAX_CONCURRENCY_PER_HOST = 2
+# after this many seconds, whatever is done gets returned and the rest is reported as timed out
+READ_BATCH_DEADLINE = 60
 
 async def read_multiple_files_or_urls(
     paths: list,
     purpose: str,
-    memory: str
+    memory: str,
+    deadline: int = None,
+    max_concurrency: int = None,
+    max_concurrency_per_host: int = None,
+    rank: bool = False,
+    ctx: Context = None,
 ):
     """
-    processes multiple files or url's in sequence. can process the exact same data types as read_file_or_url.
+    processes multiple files or url's at the same time. can process the exact same data types as read_file_or_url.
     use this instead of read_file_or_url if user provided multiple files or url's!
 
     use the "purpose" argument to describe the purpose of this request.
     use the "memory" argument for details that must be remembered by the LLM after parsing all the data, such as details about the user.
+    use the "deadline" argument to set how many seconds to wait at most. anything that isn't done by then is reported as timed out.
+    use the "max_concurrency" and "max_concurrency_per_host" arguments to limit how many paths are read at once, in total and per website.
+    set "rank" to true to only get the passages most relevant to the purpose from each file or url, instead of everything.
     """
 
-    output = []
-
     utils.console_log("processing multiple files asynchronously..")
 
-    # limit to 4 threads at once
-    semaphore = asyncio.Semaphore(4)
+    deadline = deadline or READ_BATCH_DEADLINE
+    max_concurrency = max_concurrency or READ_MAX_CONCURRENCY
+    max_concurrency_per_host = max_concurrency_per_host or READ_MAX_CONCURRENCY_PER_HOST
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # so that a handful of links to the same site don't all hit it at once
+    host_semaphores = {}
+
+    def get_path(path):
+        try:
+            # for if the AI adds the url as a dict for some reason. it often does that!
+            return path["path"]
+        except:
+            return path
 
     async def handle_one(path, i):
-        async with semaphore:
-            try:
-                # for if the AI adds the url as a dict for some reason. it often does that!
-                path = path["path"]
-            except:
-                pass
+        host = urllib.parse.urlparse(str(path)).netloc.lower()
+        if host:
+            host_semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(max_concurrency_per_host))
+        else:
+            # local files don't need to be nice to anyone
+            host_semaphore = contextlib.nullcontext()
 
+        # wait for the website first, so reads queued up behind a busy one don't take up
+        # slots that reads of other websites could use
+        async with host_semaphore, semaphore:
             try:
                 utils.console_log(f"thread {i}: launching..")
                 result = await read_file_or_url(
-                    path, purpose, memory, multi=True
+                    path, purpose, memory, multi=True, rank=rank
                 )
                 utils.console_log(f"thread {i}: finished!")
                 return result
             except Exception as e:
                 return [f"ERROR Processing path {path}: {e}"]
 
-    tasks = [handle_one(path, i) for i, path in enumerate(paths)]
-    output = await asyncio.gather(*tasks)
+    paths = [get_path(path) for path in paths]
+    tasks = {
+        asyncio.create_task(handle_one(path, i)): i
+        for i, path in enumerate(paths)
+    }
 
-    return {
+    output = [None] * len(paths)
+    finished = 0
+
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline
+
+    pending = set(tasks)
+    while pending:
+        timeout = deadline_at - loop.time()
+        if timeout <= 0:
+            break
+
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            i = tasks[task]
+            output[i] = task.result()
+            finished += 1
+
+            if ctx:
+                # send every result as soon as it's there, so the client doesn't have to wait for the slowest one
+                await ctx.report_progress(
+                    finished,
+                    len(paths),
+                    json.dumps({"path": paths[i], "result": output[i]}, default=str),
+                )
+
+    timed_out = []
+    for task in pending:
+        i = tasks[task]
+        task.cancel()
+        output[i] = [f"ERROR Processing path {paths[i]}: timed out after {deadline} seconds"]
+        timed_out.append(paths[i])
+
+    result = {
         "results": output,
         "ai_instructions": {
             "important_details": memory,
@@ -574,6 +1531,11 @@ async def read_multiple_files_or_urls(
         },
     }
 
+    if timed_out:
+        result["timed_out"] = timed_out
+
+    return result
+
 def register_mcp(mcp):
     mcp.tool(read_file_or_url)
     mcp.tool(read_multiple_files_or_urls)
@@ -12,6 +12,23 @@ OS = platform.system().lower()
 #OS = "windows"
 
 # --- information ---
+def get_server_diagnostics(audit_blocking_io: bool = None, clear: bool = False) -> dict:
+    """
+    returns what the event loop monitor has seen: stalls of the MCP server's event loop, the tool that caused them and what it was doing.
+    set "audit_blocking_io" to true to also record blocking file, network and process calls made from async code, or false to stop. it slows the server down a little.
+    set "clear" to true to forget everything recorded so far, after returning it.
+    """
+    import monitor
+
+    if audit_blocking_io is not None:
+        monitor.set_audit(audit_blocking_io)
+
+    report = monitor.get_report()
+    if clear:
+        monitor.clear()
+
+    return utils.result(report)
+
 def get_datetime() -> dict:
     """gets the current time and date"""
 
@@ -443,6 +460,7 @@ def media_stop() -> dict:
     return utils.sh_exec_result("playerctl stop")
 
 def register_mcp(mcp):
+    mcp.tool(get_server_diagnostics)
     mcp.tool(get_datetime)
     mcp.tool(get_home_dir_path)
     mcp.tool(get_system_info)
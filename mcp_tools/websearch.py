@@ -1,65 +1,200 @@
 import utils
+import cache
+import html_extract
 import asyncio
 import urllib
 
 from mcp_tools import reader
 
-async def search_web(query: str, purpose: str, memory: str, limit: int = 4):
-    """
-    search the web for a query. uses read_multiple_files_or_urls internally to process the resulting pages.
+SEARCH_URL = "https://html.duckduckgo.com/html/"
 
-    use the "purpose" argument to describe the purpose of this request.
-    use the "memory" argument for details that must be remembered by the LLM after parsing all the data, such as details about the user.
-    use the "limit" argument to specify how many results to fetch. defaults to 4.
+def parse_results(html, backend=None):
+    """
+    pulls the organic results out of a duckduckgo results page in a single pass.
+    returns a list of {"url", "title", "snippet"}, without ads and duckduckgo's own links
     """
 
-    url = f"https://duckduckgo.com/html/?q={query.replace(' ', '+')}"
+    backend = backend or html_extract.get_default_backend()
+    html = html_extract.decode(html)
+
+    try:
+        elements = list(html_extract.BACKENDS[backend](html))
+    except Exception:
+        if backend == "bs4":
+            raise
+        return parse_results(html, backend="bs4")
+
+    results = []
+    seen = set()
+    current = None
+    in_ad = False
+
+    for tag, class_name, id_name, attrs, get_text in elements:
+        classes = (class_name or "").split()
+
+        # every result, ad or not, starts with one of these
+        if "result" in classes:
+            in_ad = "result--ad" in classes
+            current = None
+        if in_ad:
+            continue
 
-    html = await utils.http_request(url)
+        if "result__a" in classes:
+            url = clean_url(attrs.get("href") or "")
+            if not url or url in seen:
+                current = None
+                continue
+
+            seen.add(url)
+            current = {
+                "url": url,
+                "title": get_text().strip(),
+                "snippet": "",
+            }
+            results.append(current)
+        elif "result__snippet" in classes and current is not None:
+            current["snippet"] = " ".join(get_text().split())
+
+    return results
+
+def clean_url(url):
+    """turns a duckduckgo redirect link into the url it points to"""
+
+    parsed = urllib.parse.urlparse(url)
+    if parsed.netloc.endswith("duckduckgo.com") or (not parsed.netloc and parsed.path.startswith("/l/")):
+        # get rid of duckduckgo's garbage
+        target = urllib.parse.parse_qs(parsed.query).get("uddg")
+        if not target:
+            return None
+        url = target[0]
 
-    output = []
+    if not url.startswith(("http://", "https://")):
+        return None
 
-    import re
-    from bs4 import BeautifulSoup
+    return url
 
-    soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
+async def search(query):
+    """searches duckduckgo, or reuses the results of a recent identical search"""
 
-    urls = []
+    results = cache.get_search("duckduckgo", query)
+    if results is not None:
+        utils.console_log("using cached search results")
+        return results
 
-    headers = []
-    for header in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-        headers.append(header.get_text().strip())
+    html = await utils.http_request(f"{SEARCH_URL}?q={urllib.parse.quote_plus(query)}")
+    results = await asyncio.to_thread(parse_results, html)
 
-    for a in soup.find_all("a", href=True):
-        urls.append(a["href"])
+    # an empty page usually means we got rate limited, don't remember that
+    if results:
+        cache.store_search("duckduckgo", query, results)
 
-    urls = utils.remove_duplicates(urls)
+    return results
 
-    processed_urls = []
-    for url in urls:
-        # get rid of duckduckgo's garbage
-        url = url.replace("//duckduckgo.com", "")
-        url = url.replace("/l/?uddg=", "")
+# how many extra results to start reading, so a slow or dead site doesn't hold up the answer
+SEARCH_HEDGE_EXTRA = 2
+# after this many seconds, whatever has been read so far is returned
+SEARCH_LATENCY_BUDGET = 10
+
+async def read_results(urls, limit, purpose, memory, rank=False):
+    """
+    reads the first `limit` urls that work. a few more than needed are read at the same time,
+    and whenever one fails, the next candidate takes its place. stops at the latency budget
+    """
+
+    candidates = list(urls)
+    tasks = {}
+
+    def start_next():
+        if candidates:
+            url = candidates.pop(0)
+            tasks[asyncio.create_task(reader.read_file_or_url(url, purpose, memory, multi=True, rank=rank))] = url
+
+    for _ in range(limit + SEARCH_HEDGE_EXTRA):
+        start_next()
+
+    # by position in the search results, so the best results still come first
+    positions = {url: i for i, url in enumerate(urls)}
+    results = []
+    errors = []
+
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + SEARCH_LATENCY_BUDGET
+
+    pending = set(tasks)
+    while pending and len(results) < limit:
+        timeout = deadline_at - loop.time()
+        if timeout <= 0:
+            break
+
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            url = tasks[task]
+            try:
+                result = task.result()
+            except Exception as e:
+                result = utils.result(None, str(e))
+
+            if result.get("status") == "error":
+                utils.console_log(f"couldn't read {url}, trying the next result..")
+                errors.append(f"ERROR Processing path {url}: {result.get('error')}")
+                start_next()
+                pending |= {task for task in tasks if not task.done()}
+            else:
+                results.append((positions[url], result))
+
+    # we have enough, or we're out of time. don't wait for the stragglers
+    for task in pending:
+        task.cancel()
+        errors.append(f"ERROR Processing path {tasks[task]}: timed out after {SEARCH_LATENCY_BUDGET} seconds")
+
+    results = [result for i, result in sorted(results, key=lambda item: item[0])[:limit]]
+    if len(results) < limit:
+        # let the LLM know why it's getting less than it asked for
+        results += errors[:limit - len(results)]
+
+    return results
+
+# how much of the results search_web can read, from least to most
+SEARCH_DEPTHS = ("snippets", "top", "full")
+
+async def search_web(query: str, purpose: str, memory: str, limit: int = 4, depth: str = "full", rank: bool = False):
+    """
+    search the web for a query. processes the resulting pages the same way read_multiple_files_or_urls does.
+
+    use the "purpose" argument to describe the purpose of this request.
+    use the "memory" argument for details that must be remembered by the LLM after parsing all the data, such as details about the user.
+    use the "limit" argument to specify how many results to fetch. defaults to 4.
+    use the "depth" argument to pick how much to read:
+    - "snippets": only the titles and snippets of the results. very fast, often enough for simple questions
+    - "top": the snippets, plus the page of the best result
+    - "full": the snippets, plus the pages of all results. the default
+    set "rank" to true to only get the passages of each page that are most relevant to the purpose.
+    """
 
-        url = urllib.parse.unquote(url)
+    if depth not in SEARCH_DEPTHS:
+        return utils.result(None, f"depth must be one of: {', '.join(SEARCH_DEPTHS)}")
 
-        # more garbage
-        url = url.split("&rut")[0]
+    results = await search(query)
 
-        if (
-            url in ["/html/", "/feedback.html"] or
-            "/duckduckgo-help-pages/" in url or
-            url.startswith("https://duckduckgo.com")
-        ):
-            # seriously wtf duckduckgo why all the spam?
-            continue
+    output = {
+        "search_results": results[:limit],
+    }
+
+    if depth != "snippets":
+        output["results"] = await read_results(
+            [result["url"] for result in results],
+            1 if depth == "top" else limit,
+            purpose,
+            memory,
+            rank=rank,
+        )
 
-        processed_urls.append(url)
+    output["ai_instructions"] = {
+        "important_details": memory,
+        "purpose_of_request": f"{purpose}. Include links to all sources.",
+    }
 
-    return await reader.read_multiple_files_or_urls(
-        # limit amount of results returned
-        processed_urls[:limit], purpose, memory
-    )
+    return output
 
 def register_mcp(mcp):
     mcp.tool(search_web)
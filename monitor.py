@@ -0,0 +1,250 @@
+import sys
+import time
+import asyncio
+import datetime
+import weakref
+import threading
+import traceback
+import contextvars
+import collections
+
+from fastmcp.server.middleware import Middleware
+
+import utils
+
+# watches the event loop for stalls: anything that runs on the loop without awaiting
+# holds up every other tool call until it's done. a thread checks on the loop regularly,
+# and if the loop hasn't checked in for a while, records what it's stuck on
+
+# a loop that doesn't respond for this many seconds counts as stalled
+STALL_THRESHOLD = 0.1
+# how often the loop checks in, in seconds
+STALL_CHECK_INTERVAL = 0.02
+# how many stalls and blocking calls to remember
+STALL_HISTORY = 100
+# how many frames of the stack to record
+STALL_STACK_DEPTH = 12
+
+# when enabled, file, network and process calls made directly from a coroutine are recorded.
+# it slows everything down a little, so it's meant for debugging
+AUDIT_BLOCKING_IO = False
+# the audit events that count as blocking. see https://docs.python.org/3/library/audit_events.html
+AUDIT_EVENTS = (
+    "open",
+    "os.listdir",
+    "os.scandir",
+    "os.walk",
+    "os.remove",
+    "os.rename",
+    "shutil.copyfile",
+    "shutil.rmtree",
+    "socket.connect",
+    "socket.getaddrinfo",
+    "socket.gethostbyname",
+    "subprocess.Popen",
+    "os.system",
+    "sqlite3.connect",
+)
+
+# the tool the current task is running for. child tasks inherit it
+current_tool = contextvars.ContextVar("current_tool", default=None)
+# the same, but readable from the monitor's thread
+_task_tools = weakref.WeakKeyDictionary()
+
+_loop = None
+_loop_thread_id = None
+_heartbeat_task = None
+# the task factory that was there before ours, put back when the monitor stops
+_previous_task_factory = None
+_last_beat = None
+_stop = None
+_stalls = collections.deque(maxlen=STALL_HISTORY)
+_blocking_calls = collections.deque(maxlen=STALL_HISTORY)
+_stats = {
+    "stalls": 0,
+    "longest_stall": 0.0,
+    "blocking_calls": 0,
+}
+_audit_hook_installed = False
+# reading the source lines for a stack sample opens files too
+_auditing = False
+
+class ToolNameMiddleware(Middleware):
+    """remembers which tool every task is running for, so stalls can be blamed on it"""
+
+    async def on_call_tool(self, context, call_next):
+        task = asyncio.current_task()
+        previous_tool = _task_tools.get(task)
+
+        token = current_tool.set(context.message.name)
+        _task_tools[task] = context.message.name
+        try:
+            return await call_next(context)
+        finally:
+            current_tool.reset(token)
+            if previous_tool:
+                _task_tools[task] = previous_tool
+            else:
+                _task_tools.pop(task, None)
+
+def _tool_of(task):
+    if task is None:
+        return None
+    return _task_tools.get(task)
+
+def _make_task_factory(previous_factory):
+    # tasks started by a tool count as part of that tool
+    def task_factory(loop, coro, **kwargs):
+        if previous_factory:
+            task = previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+
+        task_context = kwargs.get("context")
+        tool = task_context.get(current_tool) if task_context is not None else current_tool.get()
+        if tool:
+            _task_tools[task] = tool
+
+        return task
+
+    return task_factory
+
+def _format_stack(frame):
+    return [
+        f"{summary.filename}:{summary.lineno} in {summary.name}: {summary.line}"
+        for summary in traceback.extract_stack(frame, limit=STALL_STACK_DEPTH)
+    ]
+
+async def _heartbeat():
+    global _last_beat
+
+    while True:
+        _last_beat = time.monotonic()
+        await asyncio.sleep(STALL_CHECK_INTERVAL)
+
+def _watch(stop_event):
+    # gets its own stop event, so a restarted monitor doesn't keep an old thread alive
+    stall = None
+
+    while not stop_event.wait(STALL_CHECK_INTERVAL):
+        lag = time.monotonic() - _last_beat
+
+        if lag >= STALL_THRESHOLD:
+            if stall is None:
+                # catch it in the act
+                loop = _loop
+                if loop is None:
+                    break
+                frame = sys._current_frames().get(_loop_thread_id)
+                stall = {
+                    "tool": _tool_of(asyncio.current_task(loop)),
+                    "started_at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                    "stack": _format_stack(frame) if frame else [],
+                }
+            stall["duration"] = round(lag, 3)
+        elif stall is not None:
+            # the loop is back, so now we know how long it took
+            _stalls.append(stall)
+            _stats["stalls"] += 1
+            _stats["longest_stall"] = max(_stats["longest_stall"], stall["duration"])
+            utils.console_log(f"event loop stalled for {stall['duration']}s (tool: {stall['tool']})")
+            stall = None
+
+def _audit(event, args):
+    global _auditing
+
+    if not AUDIT_BLOCKING_IO or _auditing or event not in AUDIT_EVENTS:
+        return
+    # only calls made on the event loop, from a coroutine, are a problem
+    if threading.get_ident() != _loop_thread_id:
+        return
+    try:
+        task = asyncio.current_task(_loop)
+    except RuntimeError:
+        return
+    if task is None:
+        return
+    # asyncio's debug mode reads source files for its tracebacks, that's not the tool's fault
+    if sys._getframe(1).f_globals.get("__name__") in ("tokenize", "linecache"):
+        return
+
+    _auditing = True
+    try:
+        _blocking_calls.append({
+            "event": event,
+            "args": repr(args)[:200],
+            "tool": _tool_of(task),
+            "stack": _format_stack(sys._getframe(1)),
+        })
+        _stats["blocking_calls"] += 1
+    finally:
+        _auditing = False
+
+def set_audit(enabled):
+    """turns the blocking I/O audit on or off"""
+    global AUDIT_BLOCKING_IO, _audit_hook_installed
+
+    AUDIT_BLOCKING_IO = enabled
+    if enabled and not _audit_hook_installed:
+        # audit hooks can't be removed again, so it's only installed once it's needed
+        sys.addaudithook(_audit)
+        _audit_hook_installed = True
+
+    if _loop is not None:
+        # asyncio's own debug mode also logs callbacks that take too long
+        _loop.set_debug(enabled)
+        _loop.slow_callback_duration = STALL_THRESHOLD
+
+def start():
+    """starts watching the running event loop. called when the server starts"""
+    global _loop, _loop_thread_id, _last_beat, _stop, _heartbeat_task, _previous_task_factory
+
+    if _loop is not None:
+        return
+
+    _loop = asyncio.get_running_loop()
+    _loop_thread_id = threading.get_ident()
+    _last_beat = time.monotonic()
+    _stop = threading.Event()
+
+    _previous_task_factory = _loop.get_task_factory()
+    _loop.set_task_factory(_make_task_factory(_previous_task_factory))
+    _heartbeat_task = _loop.create_task(_heartbeat())
+    threading.Thread(target=_watch, args=(_stop,), name="loop-monitor", daemon=True).start()
+
+    set_audit(AUDIT_BLOCKING_IO)
+
+def stop():
+    """stops watching the event loop. called when the server shuts down"""
+    global _loop, _stop, _heartbeat_task, _previous_task_factory
+
+    if _loop is None:
+        return
+
+    _stop.set()
+    _stop = None
+    _heartbeat_task.cancel()
+    _heartbeat_task = None
+
+    if not _loop.is_closed():
+        _loop.set_task_factory(_previous_task_factory)
+    _previous_task_factory = None
+    _loop = None
+
+def get_report():
+    """returns everything the monitor has seen so far"""
+
+    return {
+        "running": _loop is not None,
+        "stall_threshold": STALL_THRESHOLD,
+        "current_lag": round(time.monotonic() - _last_beat, 3) if _last_beat else None,
+        "audit_blocking_io": AUDIT_BLOCKING_IO,
+        "stats": dict(_stats),
+        "stalls": list(_stalls),
+        "blocking_calls": list(_blocking_calls),
+    }
+
+def clear():
+    _stalls.clear()
+    _blocking_calls.clear()
+    _stats.update(stalls=0, longest_stall=0.0, blocking_calls=0)
@@ -0,0 +1,216 @@
+import re
+
+# ranks passages of extracted content by how relevant they are to the purpose of a request,
+# so only the parts that matter have to be sent back. uses BM25, which is purely lexical
+# and runs locally
+
+# how many passages to keep at most
+RANK_TOP_K = 12
+# how many characters of passages to keep at most
+RANK_MAX_CHARS = 6000
+# long texts are split into passages of about this many characters
+PASSAGE_MAX_CHARS = 800
+# these parts of an output are copied as they are, they're what's needed to make sense of the rest
+RANK_KEEP_KEYS = frozenset((
+    "title",
+    "type",
+    "language",
+    "format",
+    "metadata",
+    "outline",
+    "next_cursor",
+    "message",
+    "error",
+))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have how i if in into is it its of on or
+    so that the their them then there these they this to was were what when where which
+    who why will with you your about can do does me my we our
+""".split())
+
+TOKEN_REGEX = re.compile(r"\w+")
+SENTENCE_REGEX = re.compile(r"(?<=[.!?])\s+")
+
+def _stem(token):
+    # just enough so that "cats" finds "cat". a real stemmer would be overkill
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text):
+    return [_stem(token) for token in TOKEN_REGEX.findall(text.lower()) if token not in STOPWORDS]
+
+def _split_text(text):
+    """splits a long text into passages, along paragraphs and then sentences"""
+
+    passages = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= PASSAGE_MAX_CHARS:
+            passages.append(paragraph)
+            continue
+
+        current = ""
+        for sentence in SENTENCE_REGEX.split(paragraph):
+            if current and len(current) + len(sentence) + 1 > PASSAGE_MAX_CHARS:
+                passages.append(current)
+                current = ""
+            current = f"{current} {sentence}" if current else sentence
+
+            # no punctuation to split on, so cut it up as-is
+            while len(current) > PASSAGE_MAX_CHARS:
+                passages.append(current[:PASSAGE_MAX_CHARS])
+                current = current[PASSAGE_MAX_CHARS:]
+        if current:
+            passages.append(current)
+
+    return passages
+
+def _is_text(value):
+    # long strings without any whitespace are something like base64, not text
+    return isinstance(value, str) and not (len(value) > PASSAGE_MAX_CHARS and not re.search(r"\s", value))
+
+def split_passages(output, source=""):
+    """
+    collects the text of a processor's output as a list of (source, text) passages,
+    where source tells where in the output the text came from
+    """
+
+    passages = []
+    if isinstance(output, str):
+        if _is_text(output):
+            for text in _split_text(output):
+                if text:
+                    passages.append((source, text))
+    elif isinstance(output, dict):
+        for key, value in output.items():
+            if key in RANK_KEEP_KEYS:
+                continue
+            passages += split_passages(value, f"{source}.{key}" if source else str(key))
+    elif isinstance(output, (list, tuple)):
+        for i, value in enumerate(output):
+            passages += split_passages(value, f"{source}[{i}]")
+
+    return passages
+
+def _rebuild(output, kept, source=""):
+    """
+    puts the output back together with only the kept passages.
+    returns (output, whether it had any text, whether any of that text was kept)
+    """
+
+    if isinstance(output, str):
+        if source not in kept:
+            # not text, or nothing in it to rank
+            return output, False, False
+        texts = kept[source]
+        return "\n\n".join(texts), True, bool(texts)
+
+    if isinstance(output, dict):
+        rebuilt = {}
+        had_text = any_kept = False
+        for key, value in output.items():
+            if key in RANK_KEEP_KEYS:
+                rebuilt[key] = value
+                continue
+            value, value_had_text, value_kept = _rebuild(value, kept, f"{source}.{key}" if source else str(key))
+            had_text |= value_had_text
+            any_kept |= value_kept
+            # leave out whatever had text, but nothing relevant
+            if not value_had_text or value_kept:
+                rebuilt[key] = value
+        return rebuilt, had_text, any_kept
+
+    if isinstance(output, (list, tuple)):
+        rebuilt = []
+        had_text = any_kept = False
+        for i, value in enumerate(output):
+            value, value_had_text, value_kept = _rebuild(value, kept, f"{source}[{i}]")
+            had_text |= value_had_text
+            any_kept |= value_kept
+            if not value_had_text or value_kept:
+                rebuilt.append(value)
+        return rebuilt, had_text, any_kept
+
+    return output, False, False
+
+def bm25(passage_tokens, query_tokens):
+    """scores every passage against the query. returns a numpy array of scores"""
+    import numpy as np
+
+    terms = list(dict.fromkeys(query_tokens))
+    if not terms or not passage_tokens:
+        return np.zeros(len(passage_tokens))
+
+    term_index = {term: i for i, term in enumerate(terms)}
+
+    # only the query terms matter, so that's all we count
+    tf = np.zeros((len(passage_tokens), len(terms)))
+    lengths = np.zeros(len(passage_tokens))
+    for row, tokens in enumerate(passage_tokens):
+        lengths[row] = len(tokens)
+        for token in tokens:
+            column = term_index.get(token)
+            if column is not None:
+                tf[row, column] += 1
+
+    n = len(passage_tokens)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+
+    average_length = lengths.mean() or 1
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+
+    return (idf * tf * (BM25_K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+def rank(output, purpose, top_k=None, max_chars=None):
+    """
+    splits the text in the output of a processor into passages and keeps the ones most relevant
+    to the purpose, up to top_k passages and max_chars characters. everything that isn't text,
+    like cursors, page numbers and metadata, is copied as it is, so the output keeps its shape
+    """
+    import numpy as np
+
+    top_k = top_k or RANK_TOP_K
+    max_chars = max_chars or RANK_MAX_CHARS
+
+    passages = split_passages(output)
+    scores = bm25([tokenize(text) for source, text in passages], tokenize(purpose or ""))
+
+    # best first. a stable sort keeps the original order for passages that score the same
+    order = np.argsort(-scores, kind="stable")
+
+    selected = set()
+    chars = 0
+    for i in order:
+        if len(selected) >= top_k:
+            break
+        text = passages[i][1]
+        if chars + len(text) > max_chars:
+            continue
+        selected.add(i)
+        chars += len(text)
+
+    # every source that had passages gets an entry, even if none of them were kept
+    kept = {}
+    for i, (source, text) in enumerate(passages):
+        texts = kept.setdefault(source, [])
+        if i in selected:
+            texts.append(text)
+
+    ranked = _rebuild(output, kept)[0]
+    if not isinstance(ranked, dict):
+        ranked = {"content": ranked}
+
+    total_chars = sum(len(text) for source, text in passages)
+    ranked["dropped"] = {
+        "passages": len(passages) - len(selected),
+        "characters": total_chars - chars,
+        "total_passages": len(passages),
+    }
+
+    return ranked
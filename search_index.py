@@ -0,0 +1,285 @@
+import os
+import re
+import sqlite3
+import threading
+import contextlib
+
+import utils
+
+# a full-text index of the markdown database, stored in an sqlite file next to the data folder.
+# it's only a copy: it can be thrown away and rebuilt from the markdown files at any time.
+# uses sqlite's FTS5, which ranks results with BM25. words are stemmed, so "apple" also finds "apples"
+
+# put around matches by highlight(). characters that don't show up in markdown
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+# how many entries sync() writes to the index before letting others have a go
+INDEX_SYNC_BATCH_SIZE = 200
+
+class SearchIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # set once the index has caught up with the markdown files
+        self.ready = False
+        self._available = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                type TEXT,
+                category TEXT,
+                name TEXT,
+                size INTEGER,
+                mtime REAL,
+                UNIQUE (type, category, name)
+            )
+        """)
+        db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                name,
+                content,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        """)
+        return db
+
+    def is_available(self):
+        """checks if this sqlite has FTS5. if it doesn't, searching falls back on reading the files"""
+
+        if self._available is None:
+            try:
+                with contextlib.closing(self._connect()):
+                    pass
+                self._available = True
+            except sqlite3.Error as e:
+                utils.console_log(f"full-text search isn't available: {e}")
+                self._available = False
+
+        return self._available
+
+    def _get_row(self, db, type_name, category, name):
+        return db.execute(
+            "SELECT id, size, mtime FROM entries WHERE type=? AND category=? AND name=?",
+            (type_name, category, name),
+        ).fetchone()
+
+    def _remove_row(self, db, entry_id):
+        db.execute("DELETE FROM entries WHERE id=?", (entry_id,))
+        db.execute("DELETE FROM entries_fts WHERE rowid=?", (entry_id,))
+
+    def _store_entry(self, db, type_name, category, name, stat, content, row):
+        if row:
+            entry_id = row[0]
+            db.execute(
+                "UPDATE entries SET size=?, mtime=? WHERE id=?",
+                (stat.st_size, stat.st_mtime, entry_id),
+            )
+            db.execute("DELETE FROM entries_fts WHERE rowid=?", (entry_id,))
+        else:
+            entry_id = db.execute(
+                "INSERT INTO entries (type, category, name, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                (type_name, category, name, stat.st_size, stat.st_mtime),
+            ).lastrowid
+
+        db.execute(
+            "INSERT INTO entries_fts (rowid, name, content) VALUES (?, ?, ?)",
+            (entry_id, name, content),
+        )
+
+    def _index_entry(self, db, type_name, category, name, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+
+        row = self._get_row(db, type_name, category, name)
+
+        if stat is None:
+            if row:
+                self._remove_row(db, row[0])
+            return
+
+        if row and row[1] == stat.st_size and row[2] == stat.st_mtime:
+            # nothing changed
+            return
+
+        try:
+            with open(path, "r", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            return
+
+        self._store_entry(db, type_name, category, name, stat, content, row)
+
+    def update(self, catalog, changed):
+        """reindexes the given (type, category, name) entries. used as a catalog listener"""
+
+        if not self.is_available():
+            return
+
+        with self._lock, contextlib.closing(self._connect()) as db, db:
+            for type_name, category, name in changed:
+                self._index_entry(db, type_name, category, name, catalog.get_path(type_name, category, name))
+
+    def sync(self, catalog):
+        """
+        brings the index up to date with the catalog, only reindexing entries that changed.
+        the files are read without holding the lock, and written to the index a batch at a time,
+        so a tool that changes the database meanwhile (and updates the index) never waits long
+        """
+
+        if not self.is_available():
+            return
+
+        entries = {
+            (type_name, category, name): info
+            for type_name, category, name, info in catalog.iter_entries()
+        }
+
+        with self._lock, contextlib.closing(self._connect()) as db:
+            indexed = {
+                (type_name, category, name): (entry_id, size, mtime)
+                for entry_id, type_name, category, name, size, mtime
+                in db.execute("SELECT id, type, category, name, size, mtime FROM entries")
+            }
+
+        # gone from the database
+        removed = [indexed[key][0] for key in indexed.keys() - entries.keys()]
+        for start in range(0, len(removed), INDEX_SYNC_BATCH_SIZE):
+            with self._lock, contextlib.closing(self._connect()) as db, db:
+                for entry_id in removed[start:start + INDEX_SYNC_BATCH_SIZE]:
+                    self._remove_row(db, entry_id)
+
+        # new or changed
+        changed = [
+            key for key, info in entries.items()
+            if not (key in indexed and indexed[key][1] == info["size"] and indexed[key][2] == info["mtime"])
+        ]
+        for start in range(0, len(changed), INDEX_SYNC_BATCH_SIZE):
+            batch = []
+            for key in changed[start:start + INDEX_SYNC_BATCH_SIZE]:
+                path = catalog.get_path(*key)
+                try:
+                    stat = os.stat(path)
+                    with open(path, "r", errors="replace") as f:
+                        content = f.read()
+                except OSError:
+                    stat = content = None
+                batch.append((key, path, stat, content))
+
+            with self._lock, contextlib.closing(self._connect()) as db, db:
+                for key, path, stat, content in batch:
+                    if stat is None:
+                        # let _index_entry sort out whether it's gone
+                        self._index_entry(db, *key, path)
+                        continue
+
+                    try:
+                        current = os.stat(path)
+                    except OSError:
+                        current = None
+                    if current is None or (current.st_size, current.st_mtime) != (stat.st_size, stat.st_mtime):
+                        # it changed since we read it. the catalog hears about that and calls update()
+                        continue
+
+                    self._store_entry(db, *key, stat, content, self._get_row(db, *key))
+
+        self.ready = True
+
+    def rebuild(self, catalog):
+        """throws away the index and builds it again from the markdown files"""
+
+        if not self.is_available():
+            return
+
+        # searches go through the files until it's done
+        self.ready = False
+
+        with self._lock, contextlib.closing(self._connect()) as db, db:
+            db.execute("DELETE FROM entries")
+            db.execute("DELETE FROM entries_fts")
+
+        self.sync(catalog)
+
+    @staticmethod
+    def build_query(query):
+        """
+        turns a search query into an FTS5 query. every word has to match,
+        "quoted text" has to match as a phrase, and OR between words matches either
+        """
+
+        parts = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+            if word == "OR":
+                if parts and parts[-1] != "OR":
+                    parts.append("OR")
+                continue
+
+            text = phrase if phrase else word
+            # anything that isn't a word character would be FTS5 syntax
+            terms = re.findall(r"\w+", text)
+            if terms:
+                parts.append('"' + " ".join(terms) + '"')
+
+        while parts and parts[-1] == "OR":
+            parts.pop()
+
+        return " ".join(parts)
+
+    def search(self, query, type_name=None):
+        """
+        returns (id, type, category, name) of the entries matching the query, best match first.
+        returns None if the index can't be used, so the caller can search the files instead
+        """
+
+        if not self.ready or not self.is_available():
+            return None
+
+        fts_query = self.build_query(query)
+        if not fts_query:
+            return []
+
+        sql = """
+            SELECT entries.id, entries.type, entries.category, entries.name
+            FROM entries_fts JOIN entries ON entries.id = entries_fts.rowid
+            WHERE entries_fts MATCH ?
+        """
+        args = [fts_query]
+        if type_name is not None:
+            sql += " AND entries.type = ?"
+            args.append(type_name)
+        sql += " ORDER BY bm25(entries_fts)"
+
+        try:
+            with contextlib.closing(self._connect()) as db:
+                return db.execute(sql, args).fetchall()
+        except sqlite3.Error as e:
+            utils.console_log(f"couldn't search the index: {e}")
+            return None
+
+    def highlight(self, ids, query):
+        """
+        returns {id: content} for the given entries, with every match of the query wrapped
+        in MARK_START and MARK_END. only meant for a page of results, it's slower than search()
+        """
+
+        if not ids:
+            return {}
+
+        placeholders = ", ".join("?" * len(ids))
+        sql = f"""
+            SELECT rowid, highlight(entries_fts, 1, ?, ?)
+            FROM entries_fts
+            WHERE entries_fts MATCH ? AND rowid IN ({placeholders})
+        """
+
+        try:
+            with contextlib.closing(self._connect()) as db:
+                return dict(db.execute(sql, [MARK_START, MARK_END, self.build_query(query), *ids]))
+        except sqlite3.Error as e:
+            utils.console_log(f"couldn't search the index: {e}")
+            return {}
@@ -1,5 +1,8 @@
 import subprocess
 import os
+import io
+import hashlib
+import tempfile
 import aiohttp
 
 def get_root_path():
@@ -12,6 +15,14 @@ def get_data_path():
 
     return path
 
+def get_cache_path(*parts):
+    # caches live inside the data folder but are not a data type
+    path = os.path.join(get_data_path(), "cache", *parts)
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    return path
+
 def result(obj, error=None):
     output = {
         "data": obj,
@@ -23,17 +34,60 @@ def result(obj, error=None):
 
     return output
 
-def strip_filename(filename):
-    return filename.strip().lower().replace(" ", "_")
+def encode_cursor(state: dict) -> str:
+    """turns the state needed to continue a paginated result into an opaque string"""
+    import base64
+    import json
+
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+def decode_cursor(cursor: str) -> dict:
+    import base64
+    import json
+
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise Exception("invalid cursor! pass the cursor exactly as it was returned.")
+
+def hash_file(path, algorithm="sha256", chunk_size=1024 * 1024):
+    """hashes a file without loading all of it into memory"""
+
+    file_hash = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+# calls that are currently running, shared by everyone asking for the same thing
+_in_flight = {}
+
+async def single_flight(key, func):
+    """
+    runs the coroutine function func, unless a call with the same key is already running,
+    in which case its result is shared instead of doing the same work twice.
+    the shared call is only cancelled once everyone waiting for it has given up
+    """
+    import asyncio
+
+    entry = _in_flight.get(key)
+    if entry is None:
+        entry = _in_flight[key] = {"task": asyncio.ensure_future(func()), "waiters": 0}
+        entry["task"].add_done_callback(
+            lambda task: _in_flight.pop(key, None) if _in_flight.get(key) is entry else None
+        )
 
-def remove_duplicates(lst: list):
-    # removes duplicates from a list
+    entry["waiters"] += 1
+    try:
+        return await asyncio.shield(entry["task"])
+    finally:
+        entry["waiters"] -= 1
+        if entry["waiters"] == 0 and not entry["task"].done():
+            entry["task"].cancel()
 
-    new_lst = []
-    for item in lst:
-        if item not in new_lst:
-            new_lst.append(item)
-    return new_lst
+def strip_filename(filename):
+    return filename.strip().lower().replace(" ", "_")
 
 def console_log(text):
     print(f"\033[1;34m[MCP] {text}\033[0m")
@@ -65,16 +119,186 @@ def sh_exec_result(cmd) -> dict:
         "output": sh_exec(cmd)
     })
 
+# shared http client, created lazily on first use and closed when the server shuts down
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.3"
+HTTP_TIMEOUT = 10
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_CONNECTIONS_PER_HOST = 8
+HTTP_DNS_CACHE_TTL = 300
+HTTP_KEEPALIVE_TIMEOUT = 30
+
+_http_session = None
+
+def _http_accept_encoding():
+    # aiohttp can only decode brotli if one of the brotli modules is installed
+    try:
+        import brotli
+    except ImportError:
+        try:
+            import brotlicffi
+        except ImportError:
+            return "gzip, deflate"
+    return "gzip, deflate, br"
+
+async def get_http_session():
+    """returns the shared aiohttp session, creating it if needed"""
+    global _http_session
+
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_MAX_CONNECTIONS,
+            limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            headers={
+                "User-Agent": HTTP_USER_AGENT,
+                "Accept-Encoding": _http_accept_encoding(),
+            },
+        )
+
+    return _http_session
+
+async def close_http_session():
+    """closes the shared aiohttp session. called when the server shuts down"""
+    global _http_session
+
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+HTTP_CHUNK_SIZE = 64 * 1024
+HTTP_SNIFF_SIZE = 4096
+
+async def http_fetch(url, choose_budget=None, headers=None):
+    """
+    streams the body of a url instead of buffering all of it.
+
+    once the headers and the first few bytes are in, choose_budget is called as
+    choose_budget(content_type, content_length, head) and returns a tuple of
+    (max_bytes, spool). max_bytes is None to read everything, spool writes the body
+    to a temporary file instead of keeping it in memory.
+
+    returns a dict with either "content" or "spool_path" (the caller removes it),
+    plus the content type and charset, content length, bytes read, if the body was truncated
+    and the caching headers. if headers made it a conditional request and the server
+    answered 304, only {"not_modified": True} and the caching headers are returned.
+    """
+
+    console_log("fetching remote content..")
+
+    session = await get_http_session()
+    async with session.get(url, headers=headers) as response:
+        cache_headers = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "cache_control": response.headers.get("Cache-Control"),
+        }
+
+        if response.status == 304:
+            return {"not_modified": True, **cache_headers}
+
+        if response.status != 200:
+            raise Exception(f"Request failed with status {response.status}")
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        # the charset that came with the content type, needed to decode text that doesn't declare its own
+        charset = response.charset
+        content_length = response.content_length
+
+        # read just enough to be able to tell what we're dealing with
+        head = b""
+        while len(head) < HTTP_SNIFF_SIZE:
+            chunk = await response.content.read(HTTP_SNIFF_SIZE - len(head))
+            if not chunk:
+                break
+            head += chunk
+
+        max_bytes, spool = (None, False)
+        if choose_budget:
+            max_bytes, spool = choose_budget(content_type, content_length, head)
+
+        sink = tempfile.NamedTemporaryFile(delete=False) if spool else io.BytesIO()
+        try:
+            truncated = max_bytes is not None and len(head) > max_bytes
+            if truncated:
+                head = head[:max_bytes]
+            sink.write(head)
+            size = len(head)
+            # hashed as it comes in, so nobody has to go over the whole thing again later
+            content_hash = hashlib.sha256(head)
+
+            while not truncated:
+                chunk = await response.content.read(HTTP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if max_bytes is not None and size + len(chunk) > max_bytes:
+                    chunk = chunk[:max_bytes - size]
+                    truncated = True
+                sink.write(chunk)
+                content_hash.update(chunk)
+                size += len(chunk)
+
+            if truncated:
+                # don't hand a half-read connection back to the pool
+                response.close()
+                console_log(f"stopped fetching after {sizeof_format(size)}")
+        except BaseException:
+            sink.close()
+            if spool:
+                os.remove(sink.name)
+            raise
+
+    fetched = {
+        "content_type": content_type,
+        "charset": charset,
+        "content_length": content_length,
+        "size": size,
+        "truncated": truncated,
+        "checksum": content_hash.hexdigest(),
+        **cache_headers,
+    }
+
+    if spool:
+        sink.close()
+        fetched["spool_path"] = sink.name
+    else:
+        fetched["content"] = sink.getvalue()
+
+    return fetched
+
+async def http_fetch_range(url, start, end=None):
+    """
+    fetches part of a url using a range request. a negative start fetches the last -start bytes.
+    returns None if the server doesn't support range requests.
+    """
+
+    byte_range = f"bytes={start}" if start < 0 else f"bytes={start}-{'' if end is None else end}"
+
+    session = await get_http_session()
+    async with session.get(
+        url,
+        # compressed responses would make the offsets meaningless
+        headers={"Range": byte_range, "Accept-Encoding": "identity"},
+    ) as response:
+        if response.status != 206:
+            # the server is about to send all of it, which is exactly what we don't want
+            response.close()
+            return None
+
+        return await response.read()
+
 async def http_request(url):
     console_log("fetching remote content..")
 
-    async with aiohttp.ClientSession(
-        headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.3"}
-    ) as session:
-        async with session.get(url, timeout=10) as response:
-            if response.status != 200:
-                raise Exception(f"Request failed with status {response.status}")
-            return await response.read()
+    session = await get_http_session()
+    async with session.get(url) as response:
+        if response.status != 200:
+            raise Exception(f"Request failed with status {response.status}")
+        return await response.read()
 
 def sh_exec_sandbox(command, timeout=30, workdir=None) -> dict:
     """
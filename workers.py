@@ -0,0 +1,132 @@
+import os
+import asyncio
+import importlib
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+import utils
+
+# a pool of worker processes for CPU heavy work, like parsing documents.
+# threads don't help there because of the GIL, and running it on the event loop
+# stalls every other tool call until it's done
+
+# how many worker processes to use. set to 0 to run everything in a thread instead
+POOL_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# how long a single task may take before its worker gets killed, in seconds
+POOL_TASK_TIMEOUT = 60
+
+# imported by every worker when it starts, so the first task doesn't have to wait for it
+POOL_WARM_MODULES = (
+    "mcp_tools.reader",
+    "html_extract",
+    "bs4",
+    "pypdf",
+    "xmltodict",
+    "yaml",
+)
+
+_pool = None
+_pool_workers = POOL_WORKERS
+
+def _init_worker(modules):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            # optional parsers might not be installed
+            pass
+
+def _warm_up():
+    pass
+
+def _call(func, args, kwargs):
+    # async functions get their own event loop inside the worker
+    if asyncio.iscoroutinefunction(func):
+        return asyncio.run(func(*args, **kwargs))
+    return func(*args, **kwargs)
+
+def start_pool(workers=None):
+    """starts the worker pool and warms up its workers. called when the server starts"""
+    global _pool, _pool_workers
+
+    if workers is not None:
+        _pool_workers = workers
+
+    if _pool_workers <= 0 or _pool is not None:
+        return _pool
+
+    utils.console_log(f"starting {_pool_workers} worker processes..")
+    _pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=_pool_workers,
+        # fork doesn't mix well with the threads asyncio and aiohttp start
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(POOL_WARM_MODULES,),
+    )
+
+    # workers are only started when there's work for them, so give them some
+    for _ in range(_pool_workers):
+        _pool.submit(_warm_up)
+
+    return _pool
+
+def _kill_pool(pool):
+    global _pool
+
+    if _pool is pool:
+        _pool = None
+
+    # a worker stuck in a parser won't stop on its own
+    terminate_workers = getattr(pool, "terminate_workers", None)
+    if terminate_workers:
+        terminate_workers()
+    else:
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_pool():
+    """stops the worker pool. called when the server shuts down"""
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def run(func, *args, timeout=None, **kwargs):
+    """
+    runs func(*args, **kwargs) in the worker pool and returns the result.
+    func has to be a module-level function (sync or async) so the workers can import it.
+
+    if the task takes longer than the timeout, or its worker crashes, the pool is
+    restarted and an exception is raised. other tasks aren't affected by a crash,
+    they're retried once on the new pool.
+    """
+
+    timeout = timeout or POOL_TASK_TIMEOUT
+
+    if _pool_workers <= 0:
+        return await asyncio.wait_for(asyncio.to_thread(_call, func, args, kwargs), timeout)
+
+    for attempt in range(2):
+        pool = start_pool()
+        try:
+            future = pool.submit(_call, func, args, kwargs)
+        except (BrokenProcessPool, RuntimeError):
+            # the pool broke or got shut down between tasks
+            _kill_pool(pool)
+            continue
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            utils.console_log(f"{func.__name__} took longer than {timeout}s, restarting workers..")
+            _kill_pool(pool)
+            raise TimeoutError(f"{func.__name__} took longer than {timeout} seconds")
+        except BrokenProcessPool:
+            utils.console_log("a worker process crashed, restarting workers..")
+            _kill_pool(pool)
+
+    raise Exception(f"worker process crashed while running {func.__name__}")